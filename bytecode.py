@@ -0,0 +1,305 @@
+import operator
+import struct
+import sys
+from array import array
+from parser import (Program, Statement, VariableDeclaration, UnitConversionStatement, PrintStatement,
+                    BinaryOperation, UnitValue, NumberLiteral, Variable, FunctionCall)
+from functions import FUNCTIONS, memoize_functions
+from interpreter import EvaluationError, Quantity, BINARY_OPERATORS, convert_quantity, magnitude, final_bindings
+from lexer import value_key
+from resolver import ResolvedProgram, LocalDeclaration, LocalVariable
+
+# Opcodes. Every instruction is an (opcode, argument) pair in Bytecode.code.
+LOAD_CONST = 0   # push constants[arg]
+LOAD_UNIT = 1    # push Quantity(*constants[arg])
+LOAD_VAR = 2     # push the variable names[arg]
+STORE_VAR = 3    # pop into the variable names[arg]
+BINOP = 4        # pop right, pop left, push left OPERATORS[arg] right
+CALL_FN = 5      # pop calls[arg][1] arguments, push names[calls[arg][0]](*args)
+CONVERT = 6      # pop a quantity, output it converted to the unit names[arg]
+PRINT = 7        # pop a value and output it
+POP = 8          # pop and discard (expression statements)
+
+OPCODE_NAMES = ('LOAD_CONST', 'LOAD_UNIT', 'LOAD_VAR', 'STORE_VAR', 'BINOP',
+                'CALL_FN', 'CONVERT', 'PRINT', 'POP')
+OPERATORS = ('+', '-', '*', '/')
+NUMBER_OPERATORS = (operator.add, operator.sub, operator.mul, operator.truediv)
+
+# Serialised layout (little-endian): BYTECODE_MAGIC, a header with the code
+# length and pool sizes, the code words, the constants (a tag byte followed by
+# a float64, a float64 and unit name index, or an int as decimal text), the
+# calls as (name index, argc) pairs and finally the length-prefixed names.
+BYTECODE_MAGIC = b'UCBC\x01'
+HEADER = struct.Struct('<IIII')
+CONST_INT, CONST_FLOAT, CONST_UNIT = range(3)
+
+class Bytecode:
+    """Compiled program: array-backed code plus constant, name and call pools."""
+
+    def __init__(self):
+        self.code = array('i')
+        self.constants = []
+        self.names = []
+        self.calls = []
+        self.constant_index = {}
+        self.name_index = {}
+        self.call_index = {}
+
+    def emit(self, opcode, arg=0):
+        self.code.append(opcode)
+        self.code.append(arg)
+
+    def constant(self, value):
+        key = value_key(value)
+        if key not in self.constant_index:
+            self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_index[key]
+
+    def name(self, name):
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.name_index[name]
+
+    def call(self, name, argc):
+        key = (self.name(name), argc)
+        if key not in self.call_index:
+            self.call_index[key] = len(self.calls)
+            self.calls.append(key)
+        return self.call_index[key]
+
+    def disassemble(self):
+        lines = []
+        for pc in range(0, len(self.code), 2):
+            opcode, arg = self.code[pc], self.code[pc + 1]
+            if opcode in (LOAD_CONST, LOAD_UNIT):
+                detail = repr(self.constants[arg])
+            elif opcode in (LOAD_VAR, STORE_VAR, CONVERT):
+                detail = self.names[arg]
+            elif opcode == BINOP:
+                detail = OPERATORS[arg]
+            elif opcode == CALL_FN:
+                detail = f"{self.names[self.calls[arg][0]]}/{self.calls[arg][1]}"
+            else:
+                detail = ''
+            lines.append(f"{pc // 2:6} {OPCODE_NAMES[opcode]:<10} {detail}".rstrip())
+        return "\n".join(lines)
+
+    def to_bytes(self):
+        parts = [BYTECODE_MAGIC, HEADER.pack(len(self.code), len(self.constants), len(self.calls), len(self.names))]
+        code = array('i', self.code)
+        if sys.byteorder == 'big':
+            code.byteswap()
+        parts.append(code.tobytes())
+        for value in self.constants:
+            if isinstance(value, tuple):
+                parts.append(struct.pack('<BdI', CONST_UNIT, value[0], self.name_index[value[1]]))
+            elif isinstance(value, int):
+                digits = str(value).encode('ascii')
+                parts.append(struct.pack('<BI', CONST_INT, len(digits)) + digits)
+            else:
+                parts.append(struct.pack('<Bd', CONST_FLOAT, value))
+        for name_id, argc in self.calls:
+            parts.append(struct.pack('<II', name_id, argc))
+        for name in self.names:
+            data = name.encode('utf-8')
+            parts.append(struct.pack('<I', len(data)) + data)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data.startswith(BYTECODE_MAGIC):
+            raise ValueError("Not a compiled conversion script")
+        offset = len(BYTECODE_MAGIC)
+        code_size, constant_count, call_count, name_count = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        bytecode = cls()
+        bytecode.code.frombytes(data[offset:offset + 4 * code_size])
+        if sys.byteorder == 'big':
+            bytecode.code.byteswap()
+        offset += 4 * code_size
+
+        units = []
+        for _ in range(constant_count):
+            tag = data[offset]
+            if tag == CONST_UNIT:
+                value, name_id = struct.unpack_from('<dI', data, offset + 1)
+                offset += 13
+                units.append((len(bytecode.constants), value, name_id))
+                bytecode.constants.append(None)
+            elif tag == CONST_INT:
+                size, = struct.unpack_from('<I', data, offset + 1)
+                offset += 5
+                bytecode.constants.append(int(data[offset:offset + size]))
+                offset += size
+            else:
+                bytecode.constants.append(struct.unpack_from('<d', data, offset + 1)[0])
+                offset += 9
+        for _ in range(call_count):
+            bytecode.calls.append(struct.unpack_from('<II', data, offset))
+            offset += 8
+        for _ in range(name_count):
+            size, = struct.unpack_from('<I', data, offset)
+            offset += 4
+            bytecode.names.append(data[offset:offset + size].decode('utf-8'))
+            offset += size
+        for index, value, name_id in units:
+            bytecode.constants[index] = (value, bytecode.names[name_id])
+
+        bytecode.constant_index = {value_key(value): index for index, value in enumerate(bytecode.constants)}
+        bytecode.name_index = {name: index for index, name in enumerate(bytecode.names)}
+        bytecode.call_index = {call: index for index, call in enumerate(bytecode.calls)}
+        return bytecode
+
+    def save(self, output_file):
+        with open(output_file, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, input_file):
+        with open(input_file, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+class BytecodeCompiler:
+    """Generates Bytecode from a Program AST."""
+
+    def __init__(self):
+        self.bytecode = Bytecode()
+        self.dispatch = {
+            Program: self.compile_program,
+            ResolvedProgram: self.compile_program,
+            VariableDeclaration: self.compile_variable_declaration,
+            LocalDeclaration: self.compile_variable_declaration,
+            UnitConversionStatement: self.compile_unit_conversion,
+            PrintStatement: self.compile_print,
+            BinaryOperation: self.compile_binary_operation,
+            UnitValue: self.compile_unit_value,
+            NumberLiteral: self.compile_number,
+            Variable: self.compile_variable,
+            LocalVariable: self.compile_variable,
+            FunctionCall: self.compile_function_call,
+        }
+
+    def compile(self, node):
+        self.dispatch[node.__class__](node)
+        return self.bytecode
+
+    def compile_program(self, node):
+        for statement in node.statements:
+            self.compile(statement)
+            if not isinstance(statement, Statement):
+                self.bytecode.emit(POP)
+
+    def compile_variable_declaration(self, node):
+        self.compile(node.expression)
+        self.bytecode.emit(STORE_VAR, self.bytecode.name(node.name))
+
+    def compile_unit_conversion(self, node):
+        self.compile(node.expression)
+        self.bytecode.emit(CONVERT, self.bytecode.name(node.target_unit))
+
+    def compile_print(self, node):
+        self.compile(node.expression)
+        self.bytecode.emit(PRINT)
+
+    def compile_binary_operation(self, node):
+        self.compile(node.left)
+        self.compile(node.right)
+        self.bytecode.emit(BINOP, OPERATORS.index(node.op))
+
+    def compile_unit_value(self, node):
+        self.bytecode.name(node.unit)
+        self.bytecode.emit(LOAD_UNIT, self.bytecode.constant((node.value, node.unit)))
+
+    def compile_number(self, node):
+        self.bytecode.emit(LOAD_CONST, self.bytecode.constant(node.value))
+
+    def compile_variable(self, node):
+        self.bytecode.emit(LOAD_VAR, self.bytecode.name(node.name))
+
+    def compile_function_call(self, node):
+        for arg in node.args:
+            self.compile(arg)
+        self.bytecode.emit(CALL_FN, self.bytecode.call(node.name, len(node.args)))
+
+class VM:
+    """Stack machine for Bytecode.
+
+    Instruction arguments are resolved once when the VM is created: constants
+    (unit constants become shared Quantity objects), names, operator indexes
+    and (function, name, argc) call entries. run() can then be called any
+    number of times. Results match interpreter.Interpreter. `cache_sizes`
+    overrides the memo cache size of built-ins by name (see
+    functions.memoize_functions).
+    """
+
+    def __init__(self, bytecode, functions=FUNCTIONS, cache_sizes=None):
+        self.bytecode = bytecode
+        constants = [Quantity(*value) if isinstance(value, tuple) else value
+                     for value in bytecode.constants]
+        functions = memoize_functions(functions, cache_sizes)
+        calls = [(functions.get(bytecode.names[name_id]), bytecode.names[name_id], argc)
+                 for name_id, argc in bytecode.calls]
+        self.opcodes = []
+        self.operands = []
+        for opcode, arg in zip(bytecode.code[0::2], bytecode.code[1::2]):
+            if opcode == LOAD_CONST or opcode == LOAD_UNIT:
+                opcode, arg = LOAD_CONST, constants[arg]
+            elif opcode in (LOAD_VAR, STORE_VAR, CONVERT):
+                arg = bytecode.names[arg]
+            elif opcode == CALL_FN:
+                arg = calls[arg]
+            self.opcodes.append(opcode)
+            self.operands.append(arg)
+
+    def run(self, inputs=None, output=print):
+        environment = dict(inputs) if inputs else {}
+        operators = [BINARY_OPERATORS[op] for op in OPERATORS]
+        number_operators = NUMBER_OPERATORS
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        # Scripts are straight-line code, so the program counter only moves forward
+        for opcode, arg in zip(self.opcodes, self.operands):
+            if opcode == LOAD_CONST:
+                push(arg)
+            elif opcode == BINOP:
+                right = pop()
+                left = stack[-1]
+                if left.__class__ is Quantity or right.__class__ is Quantity:
+                    stack[-1] = operators[arg](left, right)
+                else:
+                    # Plain numbers skip the unit handling in interpreter.BINARY_OPERATORS
+                    try:
+                        stack[-1] = number_operators[arg](left, right)
+                    except ZeroDivisionError:
+                        operators[arg](left, right)
+            elif opcode == LOAD_VAR:
+                try:
+                    push(environment[arg])
+                except KeyError:
+                    raise EvaluationError(f"Undefined variable: {arg}") from None
+            elif opcode == STORE_VAR:
+                environment[arg] = pop()
+            elif opcode == CALL_FN:
+                function, name, argc = arg
+                if function is None:
+                    raise EvaluationError(f"Unknown function: {name}")
+                values = [magnitude(value) for value in stack[len(stack) - argc:]]
+                del stack[len(stack) - argc:]
+                push(function(*values))
+            elif opcode == CONVERT:
+                value = pop()
+                if value.__class__ is not Quantity:
+                    raise EvaluationError(f"Cannot convert {value} to {arg}: it has no unit")
+                output(convert_quantity(value, arg))
+            elif opcode == PRINT:
+                output(pop())
+            else:
+                pop()
+        return final_bindings(environment)
+
+def compile_bytecode(program):
+    """Compile a Program to Bytecode."""
+    return BytecodeCompiler().compile(program)
@@ -0,0 +1,168 @@
+from operator import itemgetter
+from parser import (Program, Statement, VariableDeclaration, UnitConversionStatement, PrintStatement,
+                    BinaryOperation, UnitValue, NumberLiteral, Variable, FunctionCall)
+from functions import FUNCTIONS, memoize_functions
+from interpreter import EvaluationError, Quantity, BINARY_OPERATORS, convert_quantity, magnitude, final_bindings
+from resolver import ResolvedProgram, LocalDeclaration, LocalVariable
+
+class CompiledProgram:
+    """A Program compiled to a list of pre-bound statement closures.
+
+    Calling it runs the statements against a fresh environment, optionally
+    seeded with `inputs`, and returns the final bindings. Results match
+    interpreter.Interpreter. A ResolvedProgram (see resolver) compiles to
+    statements that run against a list frame indexed by slot instead of a
+    dict keyed by name; `symbols` is then its SymbolTable.
+    """
+
+    def __init__(self, statements, symbols=None):
+        self.statements = statements
+        self.symbols = symbols
+
+    def __call__(self, inputs=None, output=print):
+        environment = dict(inputs) if inputs else {}
+        symbols = self.symbols
+        if symbols is None:
+            for statement in self.statements:
+                statement(environment, output)
+            return final_bindings(environment)
+        frame = [None] * len(symbols)
+        for name in symbols.inputs:
+            if name not in environment:
+                raise EvaluationError(f"Undefined variable: {name}")
+            frame[symbols.slots[name]] = environment[name]
+        for statement in self.statements:
+            statement(frame, output)
+        environment.update(symbols.bindings(frame))
+        return final_bindings(environment)
+
+class ClosureCompiler:
+    """Turns AST nodes into closures with their children and functions captured.
+
+    Expressions become `f(environment) -> value`, statements become
+    `f(environment, output)`. For a ResolvedProgram the environment is the
+    slot-indexed frame. `cache_sizes` overrides the memo cache size of
+    built-ins by name (see functions.memoize_functions).
+    """
+
+    def __init__(self, functions=FUNCTIONS, cache_sizes=None):
+        self.functions = memoize_functions(functions, cache_sizes)
+        self.dispatch = {
+            Program: self.compile_program,
+            ResolvedProgram: self.compile_resolved_program,
+            VariableDeclaration: self.compile_variable_declaration,
+            LocalDeclaration: self.compile_local_declaration,
+            UnitConversionStatement: self.compile_unit_conversion,
+            PrintStatement: self.compile_print,
+            BinaryOperation: self.compile_binary_operation,
+            UnitValue: self.compile_unit_value,
+            NumberLiteral: self.compile_number,
+            Variable: self.compile_variable,
+            LocalVariable: self.compile_local_variable,
+            FunctionCall: self.compile_function_call,
+        }
+
+    def compile(self, node):
+        return self.dispatch[node.__class__](node)
+
+    def compile_statement(self, node):
+        if isinstance(node, Statement):
+            return self.compile(node)
+        # Expression statement: evaluate for its effects and drop the value
+        expression = self.compile(node)
+
+        def run_expression(environment, output):
+            expression(environment)
+        return run_expression
+
+    def compile_program(self, node):
+        return CompiledProgram([self.compile_statement(statement) for statement in node.statements])
+
+    def compile_resolved_program(self, node):
+        return CompiledProgram([self.compile_statement(statement) for statement in node.statements], node.symbols)
+
+    def compile_variable_declaration(self, node):
+        name = node.name
+        expression = self.compile(node.expression)
+
+        def run_let(environment, output):
+            environment[name] = expression(environment)
+        return run_let
+
+    def compile_local_declaration(self, node):
+        slot = node.slot
+        expression = self.compile(node.expression)
+
+        def run_let(frame, output):
+            frame[slot] = expression(frame)
+        return run_let
+
+    def compile_unit_conversion(self, node):
+        target_unit = node.target_unit
+        expression = self.compile(node.expression)
+
+        def run_convert(environment, output):
+            value = expression(environment)
+            if value.__class__ is not Quantity:
+                raise EvaluationError(f"Cannot convert {value} to {target_unit}: it has no unit")
+            output(convert_quantity(value, target_unit))
+        return run_convert
+
+    def compile_print(self, node):
+        expression = self.compile(node.expression)
+
+        def run_print(environment, output):
+            output(expression(environment))
+        return run_print
+
+    def compile_binary_operation(self, node):
+        operator = BINARY_OPERATORS[node.op]
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        return lambda environment: operator(left(environment), right(environment))
+
+    def compile_unit_value(self, node):
+        quantity = Quantity(node.value, node.unit)
+        return lambda environment: quantity
+
+    def compile_number(self, node):
+        value = node.value
+        return lambda environment: value
+
+    def compile_variable(self, node):
+        name = node.name
+
+        def load(environment):
+            try:
+                return environment[name]
+            except KeyError:
+                raise EvaluationError(f"Undefined variable: {name}") from None
+        return load
+
+    def compile_local_variable(self, node):
+        # The resolver guarantees the slot is assigned before it is read
+        return itemgetter(node.slot)
+
+    def compile_function_call(self, node):
+        name = node.name
+        function = self.functions.get(name)
+        if function is None:
+            # Unknown functions fail when reached, as they do in the interpreter
+            def unknown(environment):
+                raise EvaluationError(f"Unknown function: {name}")
+            return unknown
+
+        args = [self.compile(arg) for arg in node.args]
+        if len(args) == 0:
+            return lambda environment: function()
+        if len(args) == 1:
+            arg, = args
+            return lambda environment: function(magnitude(arg(environment)))
+        if len(args) == 2:
+            first, second = args
+            return lambda environment: function(magnitude(first(environment)), magnitude(second(environment)))
+        return lambda environment: function(*[magnitude(arg(environment)) for arg in args])
+
+def compile_program(program, functions=FUNCTIONS, cache_sizes=None):
+    """Compile a Program once into a CompiledProgram that can be run many times."""
+    return ClosureCompiler(functions, cache_sizes).compile(program)
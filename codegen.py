@@ -0,0 +1,357 @@
+import re
+from functools import lru_cache
+from parser import (Program, Statement, VariableDeclaration, UnitConversionStatement, PrintStatement,
+                    BinaryOperation, UnitValue, NumberLiteral, Variable, FunctionCall)
+from functions import FUNCTIONS, memoize_functions
+from resolver import ResolvedProgram, LocalDeclaration, LocalVariable
+from interpreter import EvaluationError, Quantity, TEMPORARY_PREFIX, add, subtract, multiply, divide, convert_quantity, magnitude
+import currency
+import units
+
+CODE_CACHE_SIZE = 128   # generated functions kept, keyed by their source
+MAX_NESTING = 50        # deeper expressions are split across temporaries
+
+# Run-time helpers the generated code calls by name
+def divide_numbers(left, right):
+    if right == 0:
+        raise EvaluationError("Division by zero")
+    return left / right
+
+def divide_converted(left, right, scale, offset):
+    # Compatible units: the divisor is checked before it is converted
+    if right == 0:
+        raise EvaluationError("Division by zero")
+    if offset == 0.0:
+        return left / (right * scale)
+    return left / (right * scale + offset)
+
+def convert_currency(value, from_unit, to_unit):
+    try:
+        return currency.convert(value, from_unit, to_unit)
+    except currency.RateError as e:
+        raise EvaluationError(str(e)) from None
+
+def convert_value(value, target_unit):
+    if value.__class__ is not Quantity:
+        raise EvaluationError(f"Cannot convert {value} to {target_unit}: it has no unit")
+    return convert_quantity(value, target_unit)
+
+def load_input(inputs, name):
+    try:
+        return inputs[name]
+    except (KeyError, TypeError):
+        raise EvaluationError(f"Undefined variable: {name}") from None
+
+def fail(message):
+    raise EvaluationError(message)
+
+RUNTIME = {
+    'Quantity': Quantity,
+    'EvaluationError': EvaluationError,
+    'add': add,
+    'subtract': subtract,
+    'multiply': multiply,
+    'divide': divide,
+    'magnitude': magnitude,
+    'divide_numbers': divide_numbers,
+    'divide_converted': divide_converted,
+    'convert_currency': convert_currency,
+    'convert_value': convert_value,
+    'load_input': load_input,
+    'fail': fail,
+}
+GENERIC_OPERATORS = {'+': 'add', '-': 'subtract', '*': 'multiply', '/': 'divide'}
+
+class Code:
+    """A generated Python expression.
+
+    Typed expressions evaluate to a plain magnitude whose unit (None for a
+    plain number) is known while generating; untyped ones evaluate to the
+    interpreter's run-time value (a Quantity or a number).
+    """
+    __slots__ = ('text', 'unit', 'typed', 'depth')
+
+    def __init__(self, text, unit=None, typed=True, depth=0):
+        self.text = text
+        self.unit = unit
+        self.typed = typed
+        self.depth = depth
+
+    def value(self):
+        """The expression as a run-time value, boxing typed quantities."""
+        if self.typed and self.unit is not None:
+            return f"Quantity({self.text}, {self.unit!r})"
+        return self.text
+
+    def magnitude(self):
+        return self.text if self.typed else f"magnitude({self.text})"
+
+class PythonGenerator:
+    """Translates a Program into the source of a Python function.
+
+    The function is `run(inputs, output)`. Each `let` becomes an assignment
+    to a local, and unit values become float constants whose units are
+    tracked while generating. Sums, differences and conversions between
+    compatible units inline the precomputed `value * scale + offset` from
+    units.get_transform, and built-ins are called directly. Results match
+    interpreter.Interpreter. Anything the generator cannot type (unknown
+    variables, which may be inputs, or mixed units that fail at run time)
+    falls back to the interpreter's own arithmetic, so errors happen where
+    they would in the interpreter.
+    """
+
+    def __init__(self, functions=FUNCTIONS):
+        self.functions = functions
+        self.lines = []
+        self.locals = {}        # variable name -> (local, unit, typed)
+        self.local_names = {}   # variable name -> local
+        self.used_names = set()
+        self.temporaries = 0
+        self.dispatch = {
+            Program: self.generate_program,
+            ResolvedProgram: self.generate_program,
+            VariableDeclaration: self.generate_variable_declaration,
+            LocalDeclaration: self.generate_variable_declaration,
+            UnitConversionStatement: self.generate_unit_conversion,
+            PrintStatement: self.generate_print,
+            BinaryOperation: self.generate_binary_operation,
+            UnitValue: self.generate_unit_value,
+            NumberLiteral: self.generate_number,
+            Variable: self.generate_variable,
+            LocalVariable: self.generate_variable,
+            FunctionCall: self.generate_function_call,
+        }
+
+    def generate(self, node):
+        return self.dispatch[node.__class__](node)
+
+    def emit(self, line):
+        self.lines.append("    " + line)
+
+    def local(self, name):
+        # Locals end in '_', which no helper, temporary or built-in name does
+        local = self.local_names.get(name)
+        if local is None:
+            # ASCII only: \W keeps letters and digits such as '²' that are not valid in names
+            base = re.sub(r'[^0-9A-Za-z_]', '_', name) + '_'
+            if not base.isidentifier():
+                base = '_' + base
+            local, count = base, 0
+            while local in self.used_names:
+                count += 1
+                local = f"{base}{count}_"
+            self.used_names.add(local)
+            self.local_names[name] = local
+        return local
+
+    def spill(self, code):
+        # Keep generated expressions shallow enough for Python's own compiler
+        if code.depth < MAX_NESTING:
+            return code
+        return self.temporary(code)
+
+    def transform(self, from_unit, to_unit):
+        # (scale, offset) between compatible units, or None if the interpreter would fail
+        from_canonical = units.canonical_unit(from_unit)
+        to_canonical = units.canonical_unit(to_unit)
+        if not units.is_compatible(from_canonical, to_canonical):
+            return None
+        try:
+            return units.get_transform(from_canonical, to_canonical)
+        except ValueError:
+            return None
+
+    def temporary(self, code, position=None):
+        name = f"t{self.temporaries}"
+        self.temporaries += 1
+        line = f"    {name} = {code.text}"
+        if position is None:
+            self.lines.append(line)
+        else:
+            self.lines.insert(position, line)
+        return Code(name, code.unit, code.typed)
+
+    def generate_operands(self, nodes):
+        """Generate operands left to right, keeping the interpreter's evaluation order.
+
+        An operand that could fail is moved into a temporary when a later
+        operand had to emit lines of its own, so it still runs first.
+        """
+        operands = []
+        marks = []
+        for node in nodes:
+            operands.append(self.spill(self.generate(node)))
+            marks.append(len(self.lines))
+        for index in reversed(range(len(operands))):
+            if operands[index].depth and marks[index] < len(self.lines):
+                operands[index] = self.temporary(operands[index], marks[index])
+        return operands
+
+    def convert(self, code, from_unit, to_unit):
+        """Code converting a typed magnitude, or None if it must fail at run time."""
+        if from_unit == to_unit:
+            return code
+        from_canonical = units.canonical_unit(from_unit)
+        to_canonical = units.canonical_unit(to_unit)
+        if from_canonical == to_canonical:
+            return Code(code.text, to_unit, True, code.depth)
+        if currency.is_currency_pair(from_canonical, to_canonical) and not units.is_compatible(from_canonical, to_canonical):
+            # Rates can change between runs, so they are looked up when run
+            return Code(f"convert_currency({code.text}, {from_canonical!r}, {to_canonical!r})", to_unit, True, code.depth + 1)
+        transform = self.transform(from_unit, to_unit)
+        if transform is None:
+            return None
+        scale, offset = transform
+        # The same operations as units.make_converter, so results are identical
+        if offset == 0.0:
+            return Code(f"({code.text} * {scale!r})", to_unit, True, code.depth + 1)
+        return Code(f"({code.text} * {scale!r} + {offset!r})", to_unit, True, code.depth + 1)
+
+    def generate_program(self, node):
+        self.emit("environment = dict(inputs) if inputs else {}")
+        for statement in node.statements:
+            if isinstance(statement, Statement):
+                self.generate(statement)
+            else:
+                self.emit(self.generate(statement).text)
+        # The optimizer's temporaries stay locals (see interpreter.final_bindings)
+        bindings = ", ".join(f"{name!r}: {Code(local, unit, typed).value()}"
+                             for name, (local, unit, typed) in self.locals.items()
+                             if not name.startswith(TEMPORARY_PREFIX))
+        self.emit(f"environment.update({{{bindings}}})")
+        self.emit("return environment")
+        header = ["def run(inputs=None, output=print):"]
+        return "\n".join(header + self.lines) + "\n"
+
+    def generate_variable_declaration(self, node):
+        code = self.generate(node.expression)
+        local = self.local(node.name)
+        self.emit(f"{local} = {code.text}")
+        self.locals[node.name] = (local, code.unit, code.typed)
+
+    def generate_unit_conversion(self, node):
+        code = self.generate(node.expression)
+        target_unit = node.target_unit
+        converted = None
+        if code.typed and code.unit is not None:
+            converted = self.convert(code, code.unit, target_unit)
+        if converted is None:
+            # Plain numbers and incompatible units fail at run time, with the interpreter's message
+            self.emit(f"output(convert_value({code.value()}, {target_unit!r}))")
+            return
+        self.emit(f"output({converted.value()})")
+
+    def generate_print(self, node):
+        self.emit(f"output({self.generate(node.expression).value()})")
+
+    def generate_binary_operation(self, node):
+        left, right = self.generate_operands((node.left, node.right))
+        depth = max(left.depth, right.depth) + 1
+        op = node.op
+        if left.typed and right.typed:
+            code = self.typed_binary_operation(op, left, right, node.right, depth)
+            if code is not None:
+                return code
+        # Untyped, or mixed units that raise: the interpreter's arithmetic
+        return Code(f"{GENERIC_OPERATORS[op]}({left.value()}, {right.value()})", None, False, depth)
+
+    def typed_binary_operation(self, op, left, right, right_node, depth):
+        if op in ('+', '-'):
+            if left.unit is None and right.unit is None:
+                return Code(f"({left.text} {op} {right.text})", None, True, depth)
+            if left.unit is None or right.unit is None:
+                return None
+            converted = self.convert(right, right.unit, left.unit)
+            if converted is None:
+                return None
+            return Code(f"({left.text} {op} {converted.text})", left.unit, True, depth + 1)
+        if op == '*':
+            if left.unit is None:
+                unit = right.unit
+            elif right.unit is None:
+                unit = left.unit
+            else:
+                unit = units.multiply_units(left.unit, right.unit)
+            return Code(f"({left.text} * {right.text})", unit, True, depth)
+        if left.unit is None:
+            unit = None if right.unit is None else units.divide_units('1', right.unit)
+        elif right.unit is None:
+            unit = left.unit
+        elif units.is_compatible(units.canonical_unit(left.unit), units.canonical_unit(right.unit)):
+            if units.canonical_unit(right.unit) != units.canonical_unit(left.unit):
+                transform = self.transform(right.unit, left.unit)
+                if transform is None:
+                    return None
+                scale, offset = transform
+                return Code(f"divide_converted({left.text}, {right.text}, {scale!r}, {offset!r})", None, True, depth)
+            unit = None
+        else:
+            unit = units.divide_units(left.unit, right.unit)
+        if right_node.__class__ in (NumberLiteral, UnitValue) and right_node.value != 0:
+            return Code(f"({left.text} / {right.text})", unit, True, depth)
+        return Code(f"divide_numbers({left.text}, {right.text})", unit, True, depth)
+
+    def generate_unit_value(self, node):
+        return Code(repr(node.value), node.unit)
+
+    def generate_number(self, node):
+        return Code(repr(node.value))
+
+    def generate_variable(self, node):
+        binding = self.locals.get(node.name)
+        if binding is None:
+            # Not bound by an earlier `let`: an input, or undefined at run time
+            return Code(f"load_input(inputs, {node.name!r})", None, False, 1)
+        local, unit, typed = binding
+        return Code(local, unit, typed)
+
+    def generate_function_call(self, node):
+        if node.name not in self.functions:
+            # The interpreter fails before evaluating the arguments
+            return Code(f"fail({f'Unknown function: {node.name}'!r})", None, False, 1)
+        args = self.generate_operands(node.args)
+        depth = max((arg.depth for arg in args), default=0) + 1
+        name = "function_" + node.name
+        return Code(f"{name}({', '.join(arg.magnitude() for arg in args)})", None, True, depth)
+
+class GeneratedProgram:
+    """A Program compiled to a Python function, with its source for auditing.
+
+    Calling it runs the function with optional `inputs` and returns the final
+    bindings, as closure_compiler.CompiledProgram does.
+    """
+
+    def __init__(self, function, source):
+        self.function = function
+        self.source = source
+
+    def __call__(self, inputs=None, output=print):
+        return self.function(inputs, output)
+
+def generate_source(program, functions=FUNCTIONS):
+    """Return the Python source of the `run(inputs, output)` function for a Program."""
+    return PythonGenerator(functions).generate(program)
+
+def build_function(source, functions):
+    namespace = dict(RUNTIME)
+    for name, function in memoize_functions(functions).items():
+        namespace["function_" + name] = function
+    exec(compile(source, '<generated program>', 'exec'), namespace)
+    return namespace['run']
+
+@lru_cache(maxsize=CODE_CACHE_SIZE)
+def cached_function(source):
+    return build_function(source, FUNCTIONS)
+
+def compile_python(program, functions=FUNCTIONS):
+    """Compile a Program to a GeneratedProgram.
+
+    With the default built-ins, the compiled function is cached by its
+    source, so the same script is only compiled by Python once.
+    """
+    source = generate_source(program, functions)
+    if functions is FUNCTIONS:
+        function = cached_function(source)
+    else:
+        function = build_function(source, functions)
+    return GeneratedProgram(function, source)
@@ -0,0 +1,255 @@
+import csv
+import operator
+from array import array
+from itertools import repeat
+from parser import (Program, VariableDeclaration, UnitConversionStatement, PrintStatement,
+                    BinaryOperation, UnitValue, NumberLiteral, Variable, FunctionCall)
+from functions import FUNCTIONS, SCALAR_TRANSFORMS, BATCH_FUNCTIONS
+from interpreter import EvaluationError, Quantity, BINARY_OPERATORS, convert_quantity, magnitude, final_bindings
+import currency
+import units
+
+try:
+    import numpy
+except ImportError:  # columns fall back to array('d')
+    numpy = None
+
+NUMBER_OPERATORS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv}
+
+def vector(values):
+    """Return `values` as a float64 column: a NumPy array, or array('d') without NumPy."""
+    if numpy is not None:
+        if not hasattr(values, '__len__'):
+            return numpy.fromiter(values, dtype=numpy.float64)
+        return numpy.asarray(values, dtype=numpy.float64)
+    if isinstance(values, array) and values.typecode == 'd':
+        return values
+    return array('d', values)
+
+def apply(op, left, right):
+    # At least one side is a column; the other may be a plain float
+    if numpy is not None:
+        return op(left, right)
+    if not isinstance(left, array):
+        left = repeat(left)
+    elif not isinstance(right, array):
+        right = repeat(right)
+    return array('d', map(op, left, right))
+
+class Column:
+    """One value per input row, all in the same unit (None for plain numbers)."""
+    __slots__ = ('values', 'unit')
+
+    def __init__(self, values, unit=None):
+        self.values = vector(values)
+        self.unit = unit
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return f"Column({list(self.values)!r}, {self.unit!r})"
+
+    def rows(self):
+        """Yield the row values as the interpreter would produce them."""
+        if self.unit is None:
+            yield from self.values
+        else:
+            for value in self.values:
+                yield Quantity(value, self.unit)
+
+def scalar_column(value, length):
+    """Broadcast a plain number or Quantity to a Column of `length` rows."""
+    if value.__class__ is Quantity:
+        return Column(repeat(value.value, length), value.unit)
+    return Column(repeat(value, length))
+
+def convert_column(column, target_unit):
+    """Convert a Column the way interpreter.convert_quantity converts a Quantity."""
+    if column.unit == target_unit:
+        return column
+    from_unit = units.canonical_unit(column.unit)
+    to_unit = units.canonical_unit(target_unit)
+    if not units.is_compatible(from_unit, to_unit):
+        if currency.is_currency_pair(from_unit, to_unit):
+            try:
+                return Column(currency.convert_many(column.values, from_unit, to_unit), target_unit)
+            except currency.RateError as e:
+                raise EvaluationError(str(e)) from None
+        raise EvaluationError(f"Cannot convert {column.unit} to {target_unit}")
+    try:
+        scale, offset = units.get_transform(from_unit, to_unit)
+    except ValueError:
+        raise EvaluationError(f"No conversion factor from {column.unit} to {target_unit}") from None
+    return Column(units.apply_batch(column.values, scale, offset), target_unit)
+
+def parts(value):
+    # (magnitudes, unit) of a Column, Quantity or plain number
+    if value.__class__ is Column:
+        return value.values, value.unit
+    if value.__class__ is Quantity:
+        return value.value, value.unit
+    return value, None
+
+def column_operation(op, left, right):
+    """Apply a binary operator where at least one operand is a Column.
+
+    Unit handling follows interpreter.BINARY_OPERATORS exactly; units are the
+    same on every row, so they are worked out once for the whole column.
+    """
+    left_values, left_unit = parts(left)
+    right_values, right_unit = parts(right)
+    if op in ('+', '-'):
+        if left_unit is not None and right_unit is not None:
+            if right_unit != left_unit:
+                right_values = parts(convert_operand(right, left_unit))[0]
+            return Column(apply(NUMBER_OPERATORS[op], left_values, right_values), left_unit)
+        if left_unit is not None or right_unit is not None:
+            verb = 'add' if op == '+' else 'subtract'
+            raise EvaluationError(f"Cannot {verb} {left_unit or 'a plain number'} and {right_unit or 'a plain number'}")
+        return Column(apply(NUMBER_OPERATORS[op], left_values, right_values))
+    if op == '*':
+        if left_unit is None:
+            unit = right_unit
+        elif right_unit is None:
+            unit = left_unit
+        else:
+            unit = units.multiply_units(left_unit, right_unit)
+        return Column(apply(operator.mul, left_values, right_values), unit)
+    zero = 0 in right_values if right.__class__ is Column else right_values == 0
+    if zero:
+        raise EvaluationError("Division by zero")
+    if left_unit is None:
+        unit = None if right_unit is None else units.divide_units('1', right_unit)
+    elif right_unit is None:
+        unit = left_unit
+    elif units.is_compatible(units.canonical_unit(left_unit), units.canonical_unit(right_unit)):
+        right_values = parts(convert_operand(right, left_unit))[0]
+        unit = None
+    else:
+        unit = units.divide_units(left_unit, right_unit)
+    return Column(apply(operator.truediv, left_values, right_values), unit)
+
+def convert_operand(value, target_unit):
+    if value.__class__ is Column:
+        return convert_column(value, target_unit)
+    return convert_quantity(value, target_unit)
+
+class ColumnarInterpreter:
+    """Runs a Program once over whole columns of inputs instead of once per row.
+
+    Free variables are bound to input Columns; constant sub-expressions are
+    evaluated once with the interpreter's own arithmetic, and anything that
+    touches a column becomes one vectorised operation over all rows. Each
+    `print` / `convert` sends a Column to `output`. Row values are float64,
+    and a row that would fail (e.g. division by zero) fails the whole batch.
+    """
+
+    def __init__(self, columns, functions=FUNCTIONS, output=print):
+        self.functions = functions
+        self.output = output
+        self.environment = {}
+        self.length = None
+        for name, column in columns.items():
+            if column.__class__ is not Column:
+                column = Column(column)
+            if self.length is None:
+                self.length = len(column)
+            elif len(column) != self.length:
+                raise ValueError(f"Column {name} has {len(column)} rows, expected {self.length}")
+            self.environment[name] = column
+        if self.length is None:
+            self.length = 1
+        self.dispatch = {
+            Program: self.run_program,
+            VariableDeclaration: self.run_variable_declaration,
+            UnitConversionStatement: self.run_unit_conversion,
+            PrintStatement: self.run_print,
+            BinaryOperation: self.evaluate_binary_operation,
+            UnitValue: self.evaluate_unit_value,
+            NumberLiteral: self.evaluate_number,
+            Variable: self.evaluate_variable,
+            FunctionCall: self.evaluate_function_call,
+        }
+
+    def evaluate(self, node):
+        return self.dispatch[node.__class__](node)
+
+    def column(self, value):
+        return value if value.__class__ is Column else scalar_column(value, self.length)
+
+    def run_program(self, node):
+        for statement in node.statements:
+            self.evaluate(statement)
+        return final_bindings(self.environment)
+
+    def run_variable_declaration(self, node):
+        self.environment[node.name] = self.evaluate(node.expression)
+
+    def run_unit_conversion(self, node):
+        value = self.evaluate(node.expression)
+        if value.__class__ is Quantity:
+            value = self.column(convert_quantity(value, node.target_unit))
+        elif value.__class__ is Column and value.unit is not None:
+            value = convert_column(value, node.target_unit)
+        else:
+            raise EvaluationError(f"Cannot convert a plain number to {node.target_unit}: it has no unit")
+        self.output(value)
+        return value
+
+    def run_print(self, node):
+        self.output(self.column(self.evaluate(node.expression)))
+
+    def evaluate_binary_operation(self, node):
+        left = self.evaluate(node.left)
+        right = self.evaluate(node.right)
+        if left.__class__ is Column or right.__class__ is Column:
+            return column_operation(node.op, left, right)
+        return BINARY_OPERATORS[node.op](left, right)
+
+    def evaluate_unit_value(self, node):
+        return Quantity(node.value, node.unit)
+
+    def evaluate_number(self, node):
+        return node.value
+
+    def evaluate_variable(self, node):
+        try:
+            return self.environment[node.name]
+        except KeyError:
+            raise EvaluationError(f"Undefined variable: {node.name}") from None
+
+    def evaluate_function_call(self, node):
+        function = self.functions.get(node.name)
+        if function is None:
+            raise EvaluationError(f"Unknown function: {node.name}")
+        args = [self.evaluate(arg) for arg in node.args]
+        if not any(arg.__class__ is Column for arg in args):
+            return function(*[magnitude(arg) for arg in args])
+        if len(args) == 1 and function is FUNCTIONS.get(node.name) and node.name in SCALAR_TRANSFORMS:
+            # Scale/offset built-ins have a vectorised form
+            return Column(BATCH_FUNCTIONS[node.name](args[0].values))
+        values = [arg.values if arg.__class__ is Column else repeat(magnitude(arg)) for arg in args]
+        return Column(map(function, *values))
+
+def read_csv_columns(input_file):
+    """Read a CSV file with a header row into {name: Column}.
+
+    A header such as `distance:miles` gives the column a unit; other cells
+    must be numbers.
+    """
+    with open(input_file, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    columns = {}
+    for index, cell in enumerate(header):
+        name, _, unit = cell.strip().partition(':')
+        columns[name] = Column([float(row[index]) for row in rows], unit or None)
+    return columns
+
+def run_columns(program, columns, functions=FUNCTIONS, output=print):
+    """Run a Program over input columns (a dict of Columns or number sequences, or a CSV path)."""
+    if isinstance(columns, str):
+        columns = read_csv_columns(columns)
+    return ColumnarInterpreter(columns, functions, output).evaluate(program)
@@ -0,0 +1,216 @@
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import zlib
+from array import array
+from lexer import Token, scan, map_file, iter_buffer_tokens, collect_tokens, open_token_sink
+from parser import StreamingParser, ASTArena
+import functions
+import lexer
+import parser
+import units
+
+CACHE_DIRECTORY = '.compile-cache'
+CACHE_SIZE = 64 * 1024 * 1024  # bytes on disk before the least recently used entries go
+CACHE_FORMAT = 1
+ENTRY_SUFFIX = '.ast'
+
+# The tokens and tree of a script depend on the lexer and parser and on the
+# unit and function names they recognise
+VERSION_MODULES = (lexer, parser, units, functions)
+version_digest = None
+
+def implementation_version():
+    """Digest of the lexer/parser version: their source, the format and the Python version."""
+    global version_digest
+    if version_digest is None:
+        digest = hashlib.sha256(f"{CACHE_FORMAT} {sys.version_info[:2]} {marshal.version}".encode())
+        for module in VERSION_MODULES:
+            with open(module.__file__, 'rb') as f:
+                digest.update(f.read())
+        version_digest = digest.digest()
+    return version_digest
+
+def encode_entry(tokens, arena, errors):
+    # Tokens and the AST (an ASTArena) as columns of plain values, so
+    # marshal can write them without pickling any objects
+    token_columns = (
+        tuple(token.type for token in tokens),
+        tuple(token.value for token in tokens),
+        array('I', [token.line for token in tokens]).tobytes(),
+        array('I', [token.column for token in tokens]).tobytes(),
+    )
+    tree_columns = (
+        arena.kinds.tobytes(), arena.a.tobytes(), arena.b.tobytes(), arena.c.tobytes(),
+        arena.children.tobytes(), tuple(arena.values), arena.root,
+    )
+    return zlib.compress(marshal.dumps((token_columns, tree_columns, tuple(errors))), 1)
+
+def decode_entry(data):
+    token_columns, tree_columns, errors = marshal.loads(zlib.decompress(data))
+    types, values, line_bytes, column_bytes = token_columns
+    lines, columns = array('I'), array('I')
+    lines.frombytes(line_bytes)
+    columns.frombytes(column_bytes)
+    tokens = list(map(Token, types, values, lines, columns))
+    arena = ASTArena()
+    for column, column_bytes in zip((arena.kinds, arena.a, arena.b, arena.c, arena.children), tree_columns):
+        column.frombytes(column_bytes)
+    arena.values = list(tree_columns[5])
+    arena.root = tree_columns[6]
+    return tokens, arena.to_tree(), list(errors)
+
+class CompileCache:
+    """On-disk cache of the tokens and parsed Program of script sources.
+
+    Entries are keyed by a SHA-256 of the source text and the lexer/parser
+    version (see implementation_version), so editing either misses the
+    cache and stale entries age out. Each entry is one compressed file in
+    `directory`; once the entries take more than `max_size` bytes the least
+    recently used are deleted. The cache is best-effort: unreadable entries
+    count as misses, and an unusable directory only means nothing is stored.
+    """
+
+    def __init__(self, directory=CACHE_DIRECTORY, max_size=CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, source):
+        # `source` is a str or any bytes-like object; an mmap is hashed in place, without a copy
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        digest = hashlib.sha256(implementation_version())
+        digest.update(source)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, source):
+        """Return (tokens, program, parse errors) for `source`, or None on a miss."""
+        path = self.path(self.key(source))
+        try:
+            with open(path, 'rb') as f:
+                entry = decode_entry(f.read())
+        except OSError:  # Not cached, or the directory is unusable
+            self.misses += 1
+            return None
+        except (ValueError, EOFError, TypeError, IndexError, zlib.error):
+            self.misses += 1
+            self.remove(path)
+            return None
+        try:
+            os.utime(path)  # Marks the entry as recently used
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, source, tokens, program, errors=()):
+        """Store the tokens, Program (or its ASTArena) and recovered parse errors of `source`."""
+        arena = program if program.__class__ is ASTArena else ASTArena.from_tree(program)
+        data = encode_entry(tokens, arena, errors)
+        if len(data) > self.max_size:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Written under a temporary name and renamed, so concurrent runs never read half an entry
+            fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        except OSError:  # Unwritable directory: skip the store
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, self.path(self.key(source)))
+        except OSError:
+            self.remove(temporary)
+            return
+        self.evict()
+
+    def entries(self):
+        """Return (last used, size, path) for every entry, least recently used first."""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:  # Evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            self.remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self.remove(path)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def cached_parse(cache, source, lex, output_file):
+    entry = cache.get(source)
+    if entry is not None:
+        tokens, program, errors = entry
+        # Same side effects as a fresh scan and parse: the token output and recovered errors
+        sink = open_token_sink(output_file)
+        try:
+            sink.write_tokens(tokens)
+        finally:
+            if sink is not output_file:
+                sink.close()
+        for error in errors:
+            print(error)
+        return tokens, program
+    tokens = lex()
+    if isinstance(tokens, str):  # Lexical error, already reported by the lexer
+        return tokens, None
+    # Parsed into an arena, which is what gets stored, then expanded into a tree
+    arena = ASTArena()
+    streaming_parser = StreamingParser(iter(tokens), arena)
+    streaming_parser.parse()
+    cache.put(source, tokens, arena, streaming_parser.errors)
+    return tokens, arena.to_tree()
+
+def compile_source(source_code, output_file=None, cache=None):
+    """scan() and parse() a script, reusing the cached result for a source seen before.
+
+    Returns (tokens, program); on a lexical error tokens is the message, as
+    scan() returns it, and program is None. Syntax errors that stop the
+    parse are raised and never cached.
+    """
+    cache = cache or CompileCache()
+    return cached_parse(cache, source_code, lambda: scan(source_code, output_file), output_file)
+
+def compile_file(input_file, output_file=None, cache=None):
+    """Like compile_source, but for a script file.
+
+    The file is memory-mapped once: the cache key is hashed from the mapping
+    and, on a miss, MappedLexer lexes the same mapping, so the source is
+    never read into a bytes object.
+    """
+    cache = cache or CompileCache()
+    buffer = map_file(input_file)
+    source = b'' if buffer is None else buffer
+    return cached_parse(cache, source, lambda: collect_tokens(iter_buffer_tokens(buffer), output_file), output_file)
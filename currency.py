@@ -0,0 +1,167 @@
+import csv
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+import units
+
+DEFAULT_TTL = 3600.0  # seconds a snapshot is served before it is refreshed
+RETRY_INTERVAL = 60.0  # seconds before retrying a provider that failed
+
+class RateError(Exception):
+    pass
+
+def currency_code(unit):
+    """Return the canonical code of a currency unit (e.g. 'USD' -> 'usd'), or None."""
+    found = units.lookup_unit(unit)
+    if found is None or found.dimension != units.DIMENSIONS[units.UnitType.CURRENCY]:
+        return None
+    return found.name
+
+class RateSnapshot:
+    """An immutable set of exchange rates: units of each currency per one `base`."""
+    __slots__ = ('base', 'rates', 'timestamp')
+
+    def __init__(self, rates, base='usd', timestamp=None):
+        self.base = base
+        self.rates = MappingProxyType(dict(rates))
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def rate(self, from_code, to_code):
+        """Return how many `to_code` one `from_code` buys."""
+        try:
+            return self.rates[to_code] / self.rates[from_code]
+        except KeyError as e:
+            raise RateError(f"No exchange rate for {e.args[0]}") from None
+
+class RateProvider:
+    """Source of RateSnapshots. Subclasses implement fetch()."""
+
+    def fetch(self):
+        raise NotImplementedError
+
+class StaticRateProvider(RateProvider):
+    """Serves a fixed table of rates, by default the ones in units.CONVERSION_FACTORS."""
+
+    def __init__(self, rates=None, base='usd'):
+        if rates is None:
+            rates = {code: units.CONVERSION_FACTORS[code]
+                     for code in units.UNIT_CATEGORIES[units.UnitType.CURRENCY]}
+        self.snapshot = RateSnapshot(rates, base)
+
+    def fetch(self):
+        return self.snapshot
+
+class FileRateProvider(RateProvider):
+    """Reads rates from a local snapshot file.
+
+    JSON files look like {"base": "USD", "timestamp": 1700000000,
+    "rates": {"EUR": 0.92, ...}}; CSV files have `currency,rate` rows
+    relative to `base`. Currency codes go through the unit registry, so
+    'EUR' and 'eur' are the same currency.
+    """
+
+    def __init__(self, path, base='usd'):
+        self.path = path
+        self.base = base
+
+    def fetch(self):
+        if os.path.splitext(self.path)[1].lower() == '.csv':
+            with open(self.path, newline='') as f:
+                rows = [row for row in csv.reader(f) if row and not row[0].startswith('#')]
+            if rows and rows[0][0].strip().lower() == 'currency':
+                rows = rows[1:]
+            base, timestamp = self.base, os.path.getmtime(self.path)
+            raw = {row[0]: row[1] for row in rows}
+        else:
+            with open(self.path) as f:
+                data = json.load(f)
+            base, timestamp = data.get('base', self.base), data.get('timestamp')
+            raw = data['rates']
+        rates = {}
+        for code, rate in raw.items():
+            canonical = currency_code(code.strip())
+            if canonical is None:
+                raise RateError(f"Unknown currency in {self.path}: {code}")
+            rates[canonical] = float(rate)
+        base = currency_code(base) or base
+        rates.setdefault(base, 1.0)
+        return RateSnapshot(rates, base, timestamp)
+
+class RateCache:
+    """Serves the provider's latest snapshot from memory, refreshing it every `ttl` seconds.
+
+    Conversions only read `snapshot`; a refresh builds a complete new
+    RateSnapshot and swaps it in with one assignment, so readers never see
+    a half-updated table. One thread refreshes at a time while the others
+    keep using the current snapshot. If the provider fails, the last good
+    snapshot stays in service and the refresh is retried later.
+    """
+
+    def __init__(self, provider, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.provider = provider
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.expires = 0.0
+        self.last_error = None
+
+    def current(self):
+        snapshot = self.snapshot
+        if snapshot is None or self.clock() >= self.expires:
+            self.refresh(blocking=snapshot is None)
+            snapshot = self.snapshot
+        return snapshot
+
+    def refresh(self, blocking=True):
+        if not self.lock.acquire(blocking):
+            return
+        try:
+            if self.snapshot is not None and self.clock() < self.expires:
+                return  # another thread refreshed while we waited
+            try:
+                snapshot = self.provider.fetch()
+            except Exception as e:
+                if self.snapshot is None:
+                    raise RateError(f"Could not load exchange rates: {e}") from e
+                self.last_error = e
+                self.expires = self.clock() + RETRY_INTERVAL
+                return
+            self.snapshot = snapshot
+            self.last_error = None
+            self.expires = self.clock() + self.ttl
+        finally:
+            self.lock.release()
+
+    def rate(self, from_unit, to_unit):
+        from_code = currency_code(from_unit)
+        to_code = currency_code(to_unit)
+        if from_code is None or to_code is None:
+            raise RateError(f"Cannot convert {from_unit} to {to_unit}: not a currency pair")
+        return self.current().rate(from_code, to_code)
+
+    def convert(self, amount, from_unit, to_unit):
+        return amount * self.rate(from_unit, to_unit)
+
+    def convert_many(self, amounts, from_unit, to_unit):
+        """Convert a whole sequence with one rate lookup (see units.apply_batch)."""
+        return units.apply_batch(amounts, self.rate(from_unit, to_unit))
+
+RATES = RateCache(StaticRateProvider())
+
+def use_provider(provider, ttl=DEFAULT_TTL):
+    """Make `provider` the source of rates for scripts, e.g. use_provider(FileRateProvider('rates.json'))."""
+    global RATES
+    RATES = RateCache(provider, ttl)
+    return RATES
+
+def is_currency_pair(unit1, unit2):
+    return currency_code(unit1) is not None and currency_code(unit2) is not None
+
+def convert(amount, from_unit, to_unit):
+    return RATES.convert(amount, from_unit, to_unit)
+
+def convert_many(amounts, from_unit, to_unit):
+    return RATES.convert_many(amounts, from_unit, to_unit)
@@ -1,82 +1,77 @@
-from units import get_conversion_factor, normalize_to_base, convert_from_base, is_compatible
-
-# Length conversion functions
-def miles_to_km(value):
-    return value * 1.60934
-
-def km_to_miles(value):
-    return value / 1.60934
-
-def meters_to_feet(value):
-    return value * 3.28084
-
-def feet_to_meters(value):
-    return value / 3.28084
-
-# Mass conversion functions
-def kg_to_pounds(value):
-    return value * 2.20462
-
-def pounds_to_kg(value):
-    return value / 2.20462
-
-def grams_to_ounces(value):
-    return value * 0.035274
-
-def ounces_to_grams(value):
-    return value / 0.035274
-
-# Time conversion functions
-def hours_to_minutes(value):
-    return value * 60
-
-def minutes_to_seconds(value):
-    return value * 60
-
-def days_to_hours(value):
-    return value * 24
-
-# Temperature conversion functions
-def celsius_to_fahrenheit(value):
-    return (value * 9/5) + 32
-
-def fahrenheit_to_celsius(value):
-    return (value - 32) * 5/9
-
-def celsius_to_kelvin(value):
-    return value + 273.15
-
-def kelvin_to_celsius(value):
-    return value - 273.15
-
-# Speed conversion functions
-def kmh_to_ms(value):
-    return value * 0.277778
-
-def ms_to_kmh(value):
-    return value / 0.277778
-
-def mph_to_kmh(value):
-    return value * 1.60934
-
-def kmh_to_mph(value):
-    return value / 1.60934
+import threading
+from collections import OrderedDict
+import units
+from units import normalize_to_base, convert_from_base, apply_batch, convert_batch
+
+DEFAULT_CACHE_SIZE = 128  # results kept per memoised built-in
+
+def pure(cache_size=DEFAULT_CACHE_SIZE, total=False):
+    """Mark a built-in as pure: its result depends only on its arguments.
+
+    Evaluators memoise pure built-ins (see memoize_functions), keeping up to
+    `cache_size` results; 0 marks a function pure but not worth caching.
+    `total` functions never raise when called with the right number of
+    numbers, so the optimizer may drop calls whose result is unused.
+    """
+    def annotate(function):
+        function.pure = True
+        function.cache_size = cache_size
+        function.total = total
+        return function
+    return annotate
+
+# Single-value converters. Every X_to_Y function is generated from the unit
+# registry as one precomputed value * scale + offset (see converter_units).
+CONVERTER_NAMES = (
+    'miles_to_km', 'km_to_miles', 'meters_to_feet', 'feet_to_meters',
+    'inches_to_cm', 'cm_to_inches', 'yards_to_meters', 'meters_to_yards',
+    'kg_to_pounds', 'pounds_to_kg', 'grams_to_ounces', 'ounces_to_grams',
+    'seconds_to_minutes', 'minutes_to_seconds', 'hours_to_minutes', 'minutes_to_hours',
+    'days_to_hours', 'hours_to_days', 'years_to_days', 'days_to_years',
+    'celsius_to_fahrenheit', 'fahrenheit_to_celsius', 'celsius_to_kelvin', 'kelvin_to_celsius',
+    'kmh_to_ms', 'ms_to_kmh', 'mph_to_kmh', 'kmh_to_mph',
+    'radians_to_degrees', 'degrees_to_radians', 'liters_to_gallons', 'gallons_to_liters',
+    'pascal_to_psi', 'psi_to_pascal', 'joules_to_calories', 'calories_to_joules',
+    'watts_to_horsepower', 'horsepower_to_watts', 'square_meters_to_square_feet', 'square_feet_to_square_meters',
+)
+
+# Words in converter names that are not unit spellings themselves
+CONVERTER_UNIT_WORDS = {'ms': 'm/s', 'kmh': 'km/h'}
+
+def converter_units(name):
+    """Return the (from, to) unit spellings of a converter name such as 'miles_to_km'"""
+    from_word, _, to_word = name.partition('_to_')
+    return CONVERTER_UNIT_WORDS.get(from_word, from_word), CONVERTER_UNIT_WORDS.get(to_word, to_word)
+
+def converter_function(name, scale, offset):
+    function = units.make_converter(scale, offset)
+    function.__name__ = function.__qualname__ = name
+    # A multiply-add is cheaper than a cache lookup
+    return pure(cache_size=0, total=True)(function)
+
+# (scale, offset) of each converter, as used by both its scalar and batch forms
+SCALAR_TRANSFORMS = {name: units.get_transform(*converter_units(name)) for name in CONVERTER_NAMES}
+CONVERTERS = {name: converter_function(name, scale, offset) for name, (scale, offset) in SCALAR_TRANSFORMS.items()}
 
 # General conversion functions
+@pure(cache_size=256)
 def convert_length(value, from_unit, to_unit):
-    factor = get_conversion_factor(from_unit, to_unit)
+    factor = units.get_conversion_factor(from_unit, to_unit)
     if isinstance(factor, tuple):
         # Temperature-like conversion needed
         base_value = normalize_to_base(value, from_unit)
         return convert_from_base(base_value, to_unit)
     return value * factor
 
+@pure(cache_size=256)
 def convert_mass(value, from_unit, to_unit):
     return convert_length(value, from_unit, to_unit)  # Same logic
 
+@pure(cache_size=256)
 def convert_time(value, from_unit, to_unit):
     return convert_length(value, from_unit, to_unit)  # Same logic
 
+@pure(cache_size=256)
 def convert_temperature(value, from_unit, to_unit):
     if from_unit == to_unit:
         return value
@@ -91,40 +86,79 @@ def convert_temperature(value, from_unit, to_unit):
     
     return value
 
+# Batch variants: each takes a NumPy array or any sequence / buffer of numbers
+# and converts it in one vectorised multiply-add (see units.apply_batch)
+def convert_length_batch(values, from_unit, to_unit):
+    return convert_batch(values, from_unit, to_unit)
+
+def convert_mass_batch(values, from_unit, to_unit):
+    return convert_batch(values, from_unit, to_unit)
+
+def convert_time_batch(values, from_unit, to_unit):
+    return convert_batch(values, from_unit, to_unit)
+
+def convert_temperature_batch(values, from_unit, to_unit):
+    return convert_batch(values, from_unit, to_unit)
+
+def batch_function(scale, offset):
+    def convert(values):
+        return apply_batch(values, scale, offset)
+    return convert
+
+# e.g. BATCH_FUNCTIONS['miles_to_km'](readings)
+BATCH_FUNCTIONS = {name: batch_function(scale, offset) for name, (scale, offset) in SCALAR_TRANSFORMS.items()}
+BATCH_FUNCTIONS.update({
+    'convert_length': convert_length_batch,
+    'convert_mass': convert_mass_batch,
+    'convert_time': convert_time_batch,
+    'convert_temperature': convert_temperature_batch,
+})
+
+# Not pure: currencies convert at the current exchange rate
 def normalize_unit(value, unit):
     """Convert value to SI unit"""
     return normalize_to_base(value, unit)
 
+@pure(cache_size=1024)
 def get_conversion_factor(from_unit, to_unit):
     """Wrapper around the units module function"""
-    return get_conversion_factor(from_unit, to_unit)
+    return units.get_conversion_factor(from_unit, to_unit)
 
+@pure(cache_size=1024)
 def is_compatible(unit1, unit2):
     """Wrapper around the units module function"""
-    return is_compatible(unit1, unit2)
+    return units.is_compatible(unit1, unit2)
 
 # Utility functions
+@pure(total=True)
 def currency_convert(amount, rate):
     return amount * rate
 
+@pure(total=True)
 def calculate_min(a, b):
     return min(a, b)
 
+@pure(total=True)
 def calculate_max(a, b):
     return max(a, b)
 
+@pure()
 def calculate_speed(distance, time):
     return distance / time
 
+@pure(total=True)
 def calculate_sum(*args):
     return sum(args)
 
+@pure(total=True)
 def calculate_diff(a, b):
     return a - b
 
+@pure(total=True)
 def calculate_mul(a, b):
     return a * b
 
+@pure()
 def calculate_div(a, b):
     if b == 0:
         raise ValueError("Division by zero")
@@ -132,35 +166,9 @@ def calculate_div(a, b):
 
 # Dictionary of all available functions
 FUNCTIONS = {
-    # Length conversions
-    'miles_to_km': miles_to_km,
-    'km_to_miles': km_to_miles,
-    'meters_to_feet': meters_to_feet,
-    'feet_to_meters': feet_to_meters,
-    
-    # Mass conversions
-    'kg_to_pounds': kg_to_pounds,
-    'pounds_to_kg': pounds_to_kg,
-    'grams_to_ounces': grams_to_ounces,
-    'ounces_to_grams': ounces_to_grams,
-    
-    # Time conversions
-    'hours_to_minutes': hours_to_minutes,
-    'minutes_to_seconds': minutes_to_seconds,
-    'days_to_hours': days_to_hours,
-    
-    # Temperature conversions
-    'celsius_to_fahrenheit': celsius_to_fahrenheit,
-    'fahrenheit_to_celsius': fahrenheit_to_celsius,
-    'celsius_to_kelvin': celsius_to_kelvin,
-    'kelvin_to_celsius': kelvin_to_celsius,
-    
-    # Speed conversions
-    'kmh_to_ms': kmh_to_ms,
-    'ms_to_kmh': ms_to_kmh,
-    'mph_to_kmh': mph_to_kmh,
-    'kmh_to_mph': kmh_to_mph,
-    
+    # X_to_Y conversions
+    **CONVERTERS,
+
     # General conversion functions
     'convert_length': convert_length,
     'convert_mass': convert_mass,
@@ -178,5 +186,93 @@ FUNCTIONS = {
     'calculate_sum': calculate_sum,
     'calculate_diff': calculate_diff,
     'calculate_mul': calculate_mul,
-    'calculate_div': calculate_div
-}
\ No newline at end of file
+    'calculate_div': calculate_div,
+
+    # Short names the lexer has always recognised
+    'cal_sum': calculate_sum,
+    'calc_diff': calculate_diff,
+    'calc_mul': calculate_mul,
+    'calc_div': calculate_div
+}
+
+# Built-ins whose result depends only on their arguments (no I/O, no state), so
+# calls with constant arguments may be evaluated ahead of time
+PURE_FUNCTIONS = frozenset(name for name, function in FUNCTIONS.items() if getattr(function, 'pure', False))
+
+class MemoizedFunction:
+    """A pure built-in with a bounded cache of its results.
+
+    The least recently used result is dropped once `maxsize` are held. Keys
+    include the argument types, so calculate_sum(1, 2) and
+    calculate_sum(1.0, 2.0) keep their own int and float results. Calls that
+    raise are not cached, and unhashable arguments bypass the cache.
+    """
+
+    def __init__(self, function, maxsize):
+        self.function = function
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.__name__ = function.__name__
+        self.__wrapped__ = function
+
+    def __call__(self, *args):
+        key = (args, tuple(arg.__class__ for arg in args))
+        cache = self.cache
+        try:
+            with self.lock:
+                result = cache[key]
+                cache.move_to_end(key)
+                self.hits += 1
+            return result
+        except KeyError:
+            pass
+        except TypeError:
+            return self.function(*args)
+        result = self.function(*args)
+        with self.lock:
+            self.misses += 1
+            cache[key] = result
+            if len(cache) > self.maxsize:
+                cache.popitem(last=False)
+        return result
+
+    def cache_info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.cache), 'maxsize': self.maxsize}
+
+    def cache_clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.hits = self.misses = 0
+
+# (function, cache size) -> MemoizedFunction, shared so caches outlive a single run
+MEMOIZED = {}
+
+def memoize_functions(functions, cache_sizes=None):
+    """Return a copy of `functions` with each pure built-in wrapped in its MemoizedFunction.
+
+    `cache_sizes` maps names to sizes overriding their @pure cache_size; a
+    size of 0 leaves the function unwrapped. Functions not marked pure are
+    never wrapped, even when `cache_sizes` names them.
+    """
+    memoized = {}
+    for name, function in functions.items():
+        if not getattr(function, 'pure', False):
+            memoized[name] = function # Never cached, whatever cache_sizes says
+            continue
+        size = function.cache_size
+        if cache_sizes and name in cache_sizes:
+            size = cache_sizes[name]
+        if size > 0:
+            key = (function, size)
+            if key not in MEMOIZED:
+                MEMOIZED[key] = MemoizedFunction(function, size)
+            function = MEMOIZED[key]
+        memoized[name] = function
+    return memoized
+
+def cache_stats():
+    """Return {function name: cache_info()} for every memoised built-in."""
+    return {memo.__name__: memo.cache_info() for memo in MEMOIZED.values()}
@@ -0,0 +1,184 @@
+from parser import (Program, VariableDeclaration, UnitConversionStatement, PrintStatement,
+                    BinaryOperation, UnitValue, NumberLiteral, Variable, FunctionCall)
+from functions import FUNCTIONS, memoize_functions
+from resolver import ResolvedProgram, LocalDeclaration, LocalVariable
+import currency
+import units
+
+class EvaluationError(Exception):
+    pass
+
+# Temporaries added by the optimizer (see optimizer.CommonSubexpressionEliminator)
+# are named with a '$', which no script can write, and never appear in the final
+# bindings an evaluator returns
+TEMPORARY_PREFIX = '$'
+
+def final_bindings(environment):
+    """Remove the optimizer's temporaries from `environment` and return it."""
+    temporaries = [name for name in environment if name.startswith(TEMPORARY_PREFIX)]
+    for name in temporaries:
+        del environment[name]
+    return environment
+
+class Quantity:
+    """A number carrying the unit it was written with (e.g. 10 miles)."""
+    __slots__ = ('value', 'unit')
+
+    def __init__(self, value, unit):
+        self.value = value
+        self.unit = unit
+
+    def __repr__(self):
+        return f"Quantity({self.value!r}, {self.unit!r})"
+
+    def __str__(self):
+        return f"{self.value} {self.unit}"
+
+    def __eq__(self, other):
+        return isinstance(other, Quantity) and self.value == other.value and self.unit == other.unit
+
+    def __hash__(self):
+        return hash((self.value, self.unit))
+
+def convert_quantity(quantity, target_unit):
+    """Convert a Quantity to `target_unit` with units.compatible_converter, or
+    at the current exchange rate (see currency.RATES) for currencies."""
+    if quantity.unit == target_unit:
+        return quantity
+    converter = units.compatible_converter(quantity.unit, target_unit)
+    if converter is None:
+        if currency.is_currency_pair(quantity.unit, target_unit):
+            try:
+                return Quantity(currency.convert(quantity.value, quantity.unit, target_unit), target_unit)
+            except currency.RateError as e:
+                raise EvaluationError(str(e)) from None
+        raise EvaluationError(f"Cannot convert {quantity.unit} to {target_unit}")
+    return Quantity(converter(quantity.value), target_unit)
+
+def magnitude(value):
+    return value.value if value.__class__ is Quantity else value
+
+# Arithmetic on plain numbers and Quantities. Sums and differences are taken in
+# the unit of the left operand; products and quotients of unlike units get a
+# compound unit such as 'miles/hours' (see units.divide_units).
+def add(left, right):
+    if left.__class__ is Quantity and right.__class__ is Quantity:
+        return Quantity(left.value + convert_quantity(right, left.unit).value, left.unit)
+    if left.__class__ is Quantity or right.__class__ is Quantity:
+        raise EvaluationError(f"Cannot add {left} and {right}")
+    return left + right
+
+def subtract(left, right):
+    if left.__class__ is Quantity and right.__class__ is Quantity:
+        return Quantity(left.value - convert_quantity(right, left.unit).value, left.unit)
+    if left.__class__ is Quantity or right.__class__ is Quantity:
+        raise EvaluationError(f"Cannot subtract {right} from {left}")
+    return left - right
+
+def multiply(left, right):
+    if left.__class__ is Quantity:
+        if right.__class__ is Quantity:
+            return Quantity(left.value * right.value, units.multiply_units(left.unit, right.unit))
+        return Quantity(left.value * right, left.unit)
+    if right.__class__ is Quantity:
+        return Quantity(left * right.value, right.unit)
+    return left * right
+
+def divide(left, right):
+    if magnitude(right) == 0:
+        raise EvaluationError("Division by zero")
+    if left.__class__ is Quantity:
+        if right.__class__ is Quantity:
+            if units.compatible_converter(right.unit, left.unit) is not None:
+                return left.value / convert_quantity(right, left.unit).value
+            return Quantity(left.value / right.value, units.divide_units(left.unit, right.unit))
+        return Quantity(left.value / right, left.unit)
+    if right.__class__ is Quantity:
+        return Quantity(left / right.value, units.divide_units('1', right.unit))
+    return left / right
+
+BINARY_OPERATORS = {
+    '+': add,
+    '-': subtract,
+    '*': multiply,
+    '/': divide,
+}
+
+class Interpreter:
+    """Tree-walking evaluator for Program ASTs.
+
+    Nodes are dispatched through a table keyed by node class, `let` bindings
+    live in `environment`, and `print` / `convert` statements send their
+    result to `output`. Functions from functions.FUNCTIONS are called with
+    the magnitudes of their arguments; pure ones are memoised (see
+    functions.memoize_functions), with `cache_sizes` overriding the cache
+    size of any of them by name.
+    """
+
+    def __init__(self, functions=FUNCTIONS, output=print, cache_sizes=None):
+        self.functions = memoize_functions(functions, cache_sizes)
+        self.output = output
+        self.environment = {}
+        self.dispatch = {
+            Program: self.run_program,
+            ResolvedProgram: self.run_program,
+            VariableDeclaration: self.run_variable_declaration,
+            LocalDeclaration: self.run_variable_declaration,
+            UnitConversionStatement: self.run_unit_conversion,
+            PrintStatement: self.run_print,
+            BinaryOperation: self.evaluate_binary_operation,
+            UnitValue: self.evaluate_unit_value,
+            NumberLiteral: self.evaluate_number,
+            Variable: self.evaluate_variable,
+            LocalVariable: self.evaluate_variable,
+            FunctionCall: self.evaluate_function_call,
+        }
+
+    def evaluate(self, node):
+        return self.dispatch[node.__class__](node)
+
+    def run_program(self, node):
+        evaluate = self.evaluate
+        for statement in node.statements:
+            evaluate(statement)
+        return final_bindings(self.environment)
+
+    def run_variable_declaration(self, node):
+        self.environment[node.name] = self.evaluate(node.expression)
+
+    def run_unit_conversion(self, node):
+        value = self.evaluate(node.expression)
+        if value.__class__ is not Quantity:
+            raise EvaluationError(f"Cannot convert {value} to {node.target_unit}: it has no unit")
+        result = convert_quantity(value, node.target_unit)
+        self.output(result)
+        return result
+
+    def run_print(self, node):
+        self.output(self.evaluate(node.expression))
+
+    def evaluate_binary_operation(self, node):
+        return BINARY_OPERATORS[node.op](self.evaluate(node.left), self.evaluate(node.right))
+
+    def evaluate_unit_value(self, node):
+        return Quantity(node.value, node.unit)
+
+    def evaluate_number(self, node):
+        return node.value
+
+    def evaluate_variable(self, node):
+        try:
+            return self.environment[node.name]
+        except KeyError:
+            raise EvaluationError(f"Undefined variable: {node.name}") from None
+
+    def evaluate_function_call(self, node):
+        function = self.functions.get(node.name)
+        if function is None:
+            raise EvaluationError(f"Unknown function: {node.name}")
+        evaluate = self.evaluate
+        return function(*[magnitude(evaluate(arg)) for arg in node.args])
+
+def interpret(program, output=print, cache_sizes=None):
+    """Run a Program and return the final variable bindings."""
+    return Interpreter(output=output, cache_sizes=cache_sizes).evaluate(program)
@@ -1,45 +1,160 @@
+import mmap
+import os
 import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from functions import FUNCTIONS
+from units import REGISTRY
+
+# Names lexed as FUNCTION tokens, shared by every lexer
+PREDEFINED_FUNCTIONS = frozenset(FUNCTIONS)
+
+class LexicalError(SyntaxError):
+    pass
+
+class LineIndex:
+    """Maps character offsets in a piece of source text to (line, column).
+
+    The table of line-start offsets is only built the first time a position
+    is asked for, so lexing pays nothing for line/column bookkeeping.
+    """
+    __slots__ = ('source_code', 'first_line', 'starts')
+
+    def __init__(self, source_code, first_line=1):
+        self.source_code = source_code
+        self.first_line = first_line
+        self.starts = None
+
+    def position(self, offset):
+        starts = self.starts
+        if starts is None:
+            starts = self.starts = array('Q', [0])
+            starts.extend(match.end() for match in re.finditer('\n', self.source_code))
+            self.source_code = None
+        index = bisect_right(starts, offset)
+        return self.first_line + index - 1, offset - starts[index - 1] + 1
+
+class DecodedLine:
+    """One line of a UTF-8 buffer, decoded once, with its character <-> byte offsets.
+
+    `start` and `end` are the byte offsets of the line (without its newline)
+    and `number` its line number.
+    """
+    __slots__ = ('start', 'end', 'number', 'text', 'offsets')
+
+    def __init__(self, buffer, start, end, number):
+        self.start = start
+        self.end = end
+        self.number = number
+        self.text = buffer[start:end].decode('utf-8')
+        if len(self.text) == end - start:
+            self.offsets = None # ASCII: characters and bytes line up
+        else:
+            # Byte offset of every character, and of the end of the line
+            self.offsets = array('Q', accumulate(map(len, map(str.encode, self.text)), initial=start))
+
+    def char_index(self, offset):
+        """Index in `text` of the character at byte `offset`."""
+        if self.offsets is None:
+            return offset - self.start
+        return bisect_left(self.offsets, offset)
+
+    def byte_offset(self, index):
+        """Byte offset of the character at `index` in `text`."""
+        if self.offsets is None:
+            return self.start + index
+        return self.offsets[index]
+
+class ByteLineIndex(LineIndex):
+    """LineIndex over a UTF-8 bytes buffer: offsets are byte offsets, while
+    columns are still counted in characters.
+
+    The line last asked about is kept decoded (see DecodedLine), so looking
+    up every token of a long line costs one decode of it, not one per token.
+    """
+    __slots__ = ('line',)
+
+    def __init__(self, source_code, first_line=1):
+        super().__init__(source_code, first_line)
+        self.line = None
+
+    def decoded_line(self, offset):
+        """Return the DecodedLine containing byte `offset`."""
+        line = self.line
+        if line is not None and line.start <= offset <= line.end:
+            return line
+        starts = self.starts
+        if starts is None:
+            starts = self.starts = array('Q', [0])
+            starts.extend(match.end() for match in re.finditer(b'\n', self.source_code))
+        index = bisect_right(starts, offset)
+        end = starts[index] - 1 if index < len(starts) else len(self.source_code)
+        self.line = line = DecodedLine(self.source_code, starts[index - 1], end, self.first_line + index - 1)
+        return line
+
+    def position(self, offset):
+        line = self.decoded_line(offset)
+        return line.number, line.char_index(offset) + 1
 
 class Token:
-    def __init__(self, type, value, line, column):
+    __slots__ = ('type', 'value', '_line', '_column', 'offset', 'lines')
+
+    def __init__(self, type, value, line=None, column=None, offset=None, lines=None):
         self.type = type
         self.value = value
-        self.line = line
-        self.column = column
+        self._line = line
+        self._column = column
+        self.offset = offset
+        self.lines = lines
+
+    @property
+    def line(self):
+        if self._line is None:
+            self._line, self._column = self.lines.position(self.offset)
+        return self._line
+
+    @property
+    def column(self):
+        if self._column is None:
+            self._line, self._column = self.lines.position(self.offset)
+        return self._column
 
     def __repr__(self):
         return f"({self.type}, {self.value}, {self.line}, {self.column})"
 
 class Lexer:
     def __init__(self, source_code):
+        self.reset(source_code)
+        self.unit_expected = False # After 'to', the next word is a unit spelling
+
+        self.keywords = {'let', 'convert', 'to', 'in', 'print'}
+        self.operators = {'+', '-', '*', '/', '='}
+        self.predefined_functions = PREDEFINED_FUNCTIONS # Every name in functions.FUNCTIONS
+        self.units = REGISTRY # Shared, built once in units.py
+
+    def reset(self, source_code, line=1):
+        """Start lexing new source text, numbering its first line `line`."""
         self.source_code = source_code
         self.position = 0
         self.current_char = self.source_code[self.position] if self.position < len(self.source_code) else None
-        self.line = 1
-        self.column = 1
+        self.lines = LineIndex(source_code, line)
 
-        self.keywords = {'let', 'convert', 'to', 'in', 'print'}
-        self.operators = {'+', '-', '*', '/', '='}
-        self.predefined_functions = {
-            'convert_length', 'convert_mass', 'convert_time', 'convert_temperature',
-            'normalize_unit', 'get_conversion_factor', 'is_compatible',
-            'miles_to_km', 'km_to_miles', 'meters_to_feet',
-            'feet_to_meters', 'inches_to_cm', 'cm_to_inches', 'yards_to_meters', 'meters_to_yards',
-            'pounds_to_kg', 'kg_to_pounds', 'ounces_to_grams', 'grams_to_ounces',
-            'celsius_to_fahrenheit', 'fahrenheit_to_celsius', 'kelvin_to_celsius', 'celsius_to_kelvin',
-            'seconds_to_minutes', 'minutes_to_seconds', 'hours_to_minutes', 'minutes_to_hours',
-            'days_to_hours', 'hours_to_days', 'years_to_days', 'days_to_years',
-            'currency_convert', 'calculate_min', 'calculate_max', 'calculate_speed',
-            'cal_sum', 'calc_diff', 'calc_div', 'calc_mul',
-            'radians_to_degrees', 'degrees_to_radians', 'liters_to_gallons', 'gallons_to_liters',
-            'pascal_to_psi', 'psi_to_pascal', 'joules_to_calories', 'calories_to_joules',
-            'watts_to_horsepower', 'horsepower_to_watts', 'square_meters_to_square_feet', 'square_feet_to_square_meters'
-        }
-        self.units = {'m', 'km', 'miles', 'kg', 'pounds', '°C', 'Fahrenheit', 's', 'min', 'hour', 'day', 'year', 'm/s'}
+    @property
+    def line(self):
+        return self.lines.position(self.position)[0]
+
+    @property
+    def column(self):
+        return self.lines.position(self.position)[1]
+
+    def token(self, type, value, start):
+        return Token(type, value, None, None, start, self.lines)
 
     def advance(self):
         self.position += 1
-        self.column += 1
         if self.position < len(self.source_code):
             self.current_char = self.source_code[self.position]
         else:
@@ -53,43 +168,64 @@ class Lexer:
 
     def skip_whitespace(self):
         while self.current_char is not None and self.current_char.isspace():
-            if self.current_char == '\n':
-                self.line += 1
-                self.column = 0
             self.advance()
 
     def number(self):
-        start_pos = self.position
-        start_col = self.column
+        start = self.position
         result = ''
         while self.current_char is not None and (self.current_char.isdigit() or self.current_char == '.'):
             result += self.current_char
             self.advance()
         if result.endswith('.'):
             self.error(f"Invalid number format: {result}")
-        if self.current_char is not None and self.current_char.isalpha():
-            unit = ''
-            while self.current_char is not None and self.current_char.isalpha():
+        if self.current_char is not None and (self.current_char.isalpha() or self.current_char == '°'):
+            unit = self.unit_name()
+            if unit not in self.units:
+                self.error(f"Invalid unit: {unit}")
+            return self.token('UNIT_VALUE', (float(result), unit), start)
+        return self.token('NUMBER', float(result) if '.' in result else int(result), start)
+
+    def unit_name(self):
+        # Letters (and '°', and '_' as in square_feet), each run optionally raised
+        # to a power, joined by '*' or '/' into a compound unit such as m/s^2
+        unit = ''
+        while True:
+            while self.current_char is not None and (self.current_char.isalpha() or self.current_char in '°_'):
+                unit += self.current_char
+                self.advance()
+            if self.current_char == '^' and (self.peek() or '').isdigit() or \
+                    self.current_char == '^' and self.peek() == '-' and (self.peek(2) or '').isdigit():
+                unit += self.current_char
+                self.advance()
+                if self.current_char == '-':
+                    unit += self.current_char
+                    self.advance()
+                while self.current_char is not None and self.current_char.isdigit():
+                    unit += self.current_char
+                    self.advance()
+            next_char = self.peek()
+            if self.current_char in ('/', '*') and next_char is not None and (next_char.isalpha() or next_char == '°'):
                 unit += self.current_char
                 self.advance()
-            return Token('UNIT_VALUE', (float(result), unit), self.line, start_col)
-        return Token('NUMBER', float(result) if '.' in result else int(result), self.line, start_col)
+                continue
+            return unit
 
     def identifier(self):
-        start_col = self.column
+        start = self.position
         result = ''
         while self.current_char is not None and (self.current_char.isalnum() or self.current_char == '_'):
             result += self.current_char
             self.advance()
         if result in self.keywords:
-            return Token('KEYWORD', result, self.line, start_col)
+            self.unit_expected = result == 'to'
+            return self.token('KEYWORD', result, start)
         elif result in self.predefined_functions:
-            return Token('FUNCTION', result, self.line, start_col)
+            return self.token('FUNCTION', result, start)
         else:
-            return Token('IDENTIFIER', result, self.line, start_col)
+            return self.token('IDENTIFIER', result, start)
 
     def unit_value(self, number_token):
-        start_col = self.column
+        start = self.position
         unit = ''
         while self.current_char is not None and (self.current_char.isalnum() or self.current_char in ['/', '*']):
             unit += self.current_char
@@ -98,7 +234,7 @@ class Lexer:
             self.error("Expected a unit after the number.")
         if unit not in self.units:
             self.error(f"Invalid unit: {unit}")
-        return Token('UNIT_VALUE', (number_token.value, unit), self.line, start_col)
+        return self.token('UNIT_VALUE', (number_token.value, unit), start)
 
     def get_next_token(self):
         while self.current_char is not None:
@@ -107,9 +243,12 @@ class Lexer:
             if self.current_char is None:
                 break
 
-            start_line = self.line
-            start_col = self.column
-
+            if self.unit_expected and (self.current_char.isalpha() or self.current_char == '°'):
+                # The target of 'convert ... to', spelled as in unit values: °C, m^2, km/h
+                self.unit_expected = False
+                start = self.position
+                return self.token('UNIT', self.unit_name(), start)
+            self.unit_expected = False
             if self.current_char.isdigit() or self.current_char == '.':
                 number_token = self.number()
                 if self.current_char is not None and (self.current_char.isalnum() or self.current_char in ['/', '*']):
@@ -118,46 +257,497 @@ class Lexer:
             elif self.current_char.isalpha() or self.current_char == '_':
                 return self.identifier()
             elif self.current_char in self.operators:
-                token = Token('OPERATOR', self.current_char, self.line, self.column)
+                token = self.token('OPERATOR', self.current_char, self.position)
                 self.advance()
                 return token
             elif self.current_char == ';':
-                token = Token('SEMICOLON', self.current_char, self.line, self.column)
+                token = self.token('SEMICOLON', self.current_char, self.position)
                 self.advance()
                 return token
             elif self.current_char == '(':
-                token = Token('LPAREN', self.current_char, self.line, self.column)
+                token = self.token('LPAREN', self.current_char, self.position)
                 self.advance()
                 return token
             elif self.current_char == ')':
-                token = Token('RPAREN', self.current_char, self.line, self.column)
+                token = self.token('RPAREN', self.current_char, self.position)
                 self.advance()
                 return token
             elif self.current_char == ',':
-                token = Token('COMMA', self.current_char, self.line, self.column)
+                token = self.token('COMMA', self.current_char, self.position)
                 self.advance()
                 return token
             else:
                 self.error(f"Invalid character: {self.current_char}")
 
-        return Token('EOF', None, self.line, self.column)
+        return self.token('EOF', None, self.position)
 
     def error(self, message):
-        raise SyntaxError(f"Lexical error at line {self.line}, column {self.column}: {message}")
+        raise LexicalError(f"Lexical error at line {self.line}, column {self.column}: {message}")
 
-def scan(source_code, output_file):
-    lexer = Lexer(source_code)
-    tokens =[]
-    while True:
-        try:
+# Master pattern for the table-driven engine. It only recognises the plain ASCII
+# lexemes; each alternative refuses to stop in front of a character that the
+# character-at-a-time rules would still have consumed, so anything unusual
+# (non-ASCII letters, malformed numbers, compound or unknown units) falls
+# through to Lexer.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<WHITESPACE>\s*)
+    (?:
+        (?P<UNIT_VALUE>(?P<number>[0-9]*\.?[0-9]+)(?P<unit>[A-Za-z][A-Za-z_]*)(?![0-9A-Za-z_/*^]|[^\x00-\x7f]))
+      | (?P<NUMBER>[0-9]*\.?[0-9]+(?![0-9A-Za-z./*]|[^\x00-\x7f]))
+      | (?P<NAME>[A-Za-z_][A-Za-z0-9_]*(?![0-9A-Za-z_]|[^\x00-\x7f]))
+      | (?P<OPERATOR>[-+*/=])
+      | (?P<SEMICOLON>;)
+      | (?P<LPAREN>\()
+      | (?P<RPAREN>\))
+      | (?P<COMMA>,)
+    )
+""", re.VERBOSE)
+
+class RegexLexer(Lexer):
+    """Lexer engine that matches whole lexemes with TOKEN_PATTERN.
+
+    Emits exactly the same tokens and errors as Lexer: whenever the pattern
+    does not match, the next token is produced by Lexer.get_next_token.
+    """
+
+    def get_next_token(self):
+        source = self.source_code
+        match = None if self.unit_expected else TOKEN_PATTERN.match(source, self.position)
+        if match is None:
+            # Error paths, unusual characters and EOF use the original rules
+            self.current_char = source[self.position] if self.position < len(source) else None
+            return Lexer.get_next_token(self)
+
+        kind = match.lastgroup
+        start, end = match.span(kind)
+        self.position = end
+
+        if kind == 'NAME':
+            text = source[start:end]
+            if text in self.keywords:
+                self.unit_expected = text == 'to'
+                return Token('KEYWORD', text, None, None, start, self.lines)
+            elif text in self.predefined_functions:
+                return Token('FUNCTION', text, None, None, start, self.lines)
+            return Token('IDENTIFIER', text, None, None, start, self.lines)
+        elif kind == 'UNIT_VALUE':
+            unit = match.group('unit')
+            if unit not in self.units:
+                self.position = start
+                self.current_char = source[start]
+                return Lexer.get_next_token(self)
+            return Token('UNIT_VALUE', (float(match.group('number')), unit), None, None, start, self.lines)
+        elif kind == 'NUMBER':
+            text = source[start:end]
+            return Token('NUMBER', float(text) if '.' in text else int(text), None, None, start, self.lines)
+        return Token(kind, source[start:end], None, None, start, self.lines)
+
+BYTES_TOKEN_PATTERN = re.compile(TOKEN_PATTERN.pattern.encode('ascii'), re.VERBOSE)
+
+class MappedLexer(Lexer):
+    """Lexer that works directly on a UTF-8 bytes buffer, e.g. an mmap of the file.
+
+    ASCII lexemes are matched in place with BYTES_TOKEN_PATTERN. Anything else
+    is handled by decoding only the current line and running the Lexer rules
+    over it, so tokens and errors are the same as for the decoded text.
+    """
+
+    def reset(self, source_code, line=1):
+        self.source_code = source_code
+        self.position = 0
+        self.lines = ByteLineIndex(source_code, line)
+        self.line_lexer = None # Lexer over the decoded line, see decoded_token
+
+    def get_next_token(self):
+        buffer = self.source_code
+        match = None if self.unit_expected else BYTES_TOKEN_PATTERN.match(buffer, self.position)
+        if match is None:
+            return self.decoded_token()
+
+        kind = match.lastgroup
+        start, end = match.span(kind)
+        self.position = end
+
+        if kind == 'NAME':
+            text = buffer[start:end].decode('ascii')
+            if text in self.keywords:
+                self.unit_expected = text == 'to'
+                return Token('KEYWORD', text, None, None, start, self.lines)
+            elif text in self.predefined_functions:
+                return Token('FUNCTION', text, None, None, start, self.lines)
+            return Token('IDENTIFIER', text, None, None, start, self.lines)
+        elif kind == 'UNIT_VALUE':
+            value = (float(match.group('number')), match.group('unit').decode('ascii'))
+            if value[1] not in self.units:
+                self.position = start
+                return self.decoded_token()
+            return Token('UNIT_VALUE', value, None, None, start, self.lines)
+        elif kind == 'NUMBER':
+            text = buffer[start:end]
+            return Token('NUMBER', float(text) if b'.' in text else int(text), None, None, start, self.lines)
+        return Token(kind, buffer[start:end].decode('ascii'), None, None, start, self.lines)
+
+    def decoded_token(self):
+        # No token spans a newline, so the current line is all the context the
+        # character rules need; whitespace-only remainders move on to the next line.
+        # The line is decoded once, however many of its tokens need it.
+        buffer = self.source_code
+        while True:
+            line = self.lines.decoded_line(self.position)
+            line_lexer = self.line_lexer
+            if line_lexer is None:
+                line_lexer = self.line_lexer = Lexer(line.text)
+                line_lexer.lines = LineIndex(line.text, line.number)
+            elif line_lexer.source_code is not line.text:
+                line_lexer.reset(line.text, line.number)
+            line_lexer.position = line.char_index(self.position)
+            line_lexer.unit_expected = self.unit_expected
+            line_lexer.current_char = line.text[line_lexer.position] if line_lexer.position < len(line.text) else None
+            token = line_lexer.get_next_token()
+            if token.type == 'EOF' and line.end < len(buffer):
+                self.position = line.end + 1
+                continue
+            self.position = line.byte_offset(line_lexer.position)
+            self.unit_expected = line_lexer.unit_expected
+            return Token(token.type, token.value, None, None, line.byte_offset(token.offset), self.lines)
+
+LEXER_ENGINES = {
+    'legacy': Lexer,
+    'regex': RegexLexer,
+}
+
+def iter_tokens(source_or_file, engine='regex'):
+    """Yield tokens one at a time, finishing with the EOF token.
+
+    Accepts the source text itself or an open text file. Files are lexed line
+    by line (no token spans a newline), so a script never has to be held in
+    memory as a whole.
+    """
+    if engine not in LEXER_ENGINES:
+        raise ValueError(f"Unknown lexer engine: {engine}")
+    lines = (source_or_file,) if isinstance(source_or_file, str) else source_or_file
+    lexer = None
+    line = 1
+    token = Token('EOF', None, 1, 1)
+    for text in lines:
+        if lexer is None:
+            lexer = LEXER_ENGINES[engine](text)
+        else:
+            lexer.reset(text, line)
+        while True:
             token = lexer.get_next_token()
-            tokens.append(token)
             if token.type == 'EOF':
                 break
-        except SyntaxError as e:
-            print(e) # Keep printing to console for debugging
-            return str(e) # Return the error message as a string
-    with open(output_file, 'w') as f:
+            yield token
+        line += text.count('\n')
+    yield token # EOF token of the last chunk
+
+TOKEN_TYPES = ('KEYWORD', 'IDENTIFIER', 'FUNCTION', 'OPERATOR', 'SEMICOLON', 'LPAREN',
+               'RPAREN', 'COMMA', 'NUMBER', 'UNIT_VALUE', 'EOF', 'UNIT')
+TOKEN_KINDS = {token_type: kind for kind, token_type in enumerate(TOKEN_TYPES)}
+
+def value_key(value):
+    """Interning key for a literal value, shared by every value table.
+
+    1 == 1.0 == True and 0.0 == -0.0, but they are different literals, so the
+    type is part of the key and zeros are told apart by their repr. Tuples
+    such as UNIT_VALUE values are keyed element by element.
+    """
+    kind = value.__class__
+    if kind is tuple:
+        return (tuple,) + tuple(map(value_key, value))
+    return (kind, value) if value else (kind, repr(value))
+
+class TokenStream:
+    """Struct-of-arrays token list.
+
+    Token kinds, start offsets, lengths and value-table indexes are kept in
+    `array` columns; values are interned, and lines/columns are recovered
+    lazily from a LineIndex. Indexing creates a Token on demand, so a stream
+    can be handed to Parser in place of the list returned by scan().
+    """
+
+    def __init__(self, source_code):
+        self.kinds = array('B')
+        self.starts = array('Q')
+        self.lengths = array('I')
+        self.value_ids = array('I')
+        self.values = []
+        self.value_index = {}
+        self.lines = LineIndex(source_code)
+
+    @classmethod
+    def from_source(cls, source_code, engine='regex'):
+        """Lex `source_code` into a new stream (EOF token included)."""
+        if engine not in LEXER_ENGINES:
+            raise ValueError(f"Unknown lexer engine: {engine}")
+        stream = cls(source_code)
+        lexer = LEXER_ENGINES[engine](source_code)
+        while True:
+            token = lexer.get_next_token()
+            stream.append(token, lexer.position)
+            if token.type == 'EOF':
+                return stream
+
+    def append(self, token, end):
+        start = token.offset
+        key = value_key(token.value)
+        value_id = self.value_index.get(key)
+        if value_id is None:
+            value_id = self.value_index[key] = len(self.values)
+            self.values.append(token.value)
+        self.kinds.append(TOKEN_KINDS[token.type])
+        self.starts.append(start)
+        self.lengths.append(end - start)
+        self.value_ids.append(value_id)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self.kinds)
+        return Token(TOKEN_TYPES[self.kinds[index]], self.values[self.value_ids[index]],
+                     offset=self.starts[index], lines=self.lines)
+
+    def __iter__(self):
+        for index in range(len(self.kinds)):
+            yield self[index]
+
+# Token dump sinks. scan() writes nothing unless it is given a sink (or, as
+# before, the name of a text file).
+TOKEN_BATCH_SIZE = 4096
+
+class TokenSink:
+    """Base token sink: accepts tokens and discards them."""
+
+    def write_tokens(self, tokens):
+        pass
+
+    def tee(self, tokens):
+        """Yield `tokens` unchanged while writing them to the sink in batches."""
+        batch = []
         for token in tokens:
-            f.write(f"<{token.type}, {token.value}, [Ln: {token.line}, Col: {token.column}]>\n")
-    return tokens
\ No newline at end of file
+            batch.append(token)
+            if len(batch) >= TOKEN_BATCH_SIZE:
+                self.write_tokens(batch)
+                batch = []
+            yield token
+        self.write_tokens(batch)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class NullTokenSink(TokenSink):
+    def tee(self, tokens):
+        return iter(tokens)
+
+class TextTokenSink(TokenSink):
+    """Writes the human readable `<TYPE, value, [Ln: n, Col: n]>` dump."""
+
+    def __init__(self, output_file, batch_size=TOKEN_BATCH_SIZE):
+        self.file = open(output_file, 'w')
+        self.batch_size = batch_size
+
+    def write_tokens(self, tokens):
+        lines = []
+        for token in tokens:
+            lines.append(f"<{token.type}, {token.value}, [Ln: {token.line}, Col: {token.column}]>\n")
+            if len(lines) >= self.batch_size:
+                self.file.writelines(lines)
+                lines = []
+        self.file.writelines(lines)
+
+    def close(self):
+        self.file.close()
+
+# Binary dump layout: BINARY_MAGIC, then batches of
+#   header   '<IIII' token count, string count, float count, string bytes
+#   types    uint32 per token (string table index)
+#   tags     uint8 per token (one of the VALUE_* codes below)
+#   refs     uint32 per token (string table index of the value, 0 if unused)
+#   lines    uint32 per token
+#   columns  uint32 per token
+#   floats   float64 per float / unit value
+#   lengths  uint32 per string, followed by the UTF-8 string table
+# Strings (token types, names, units, integer digits) are interned per batch.
+BINARY_MAGIC = b'TOKS\x01'
+BATCH_HEADER = struct.Struct('<IIII')
+VALUE_NONE, VALUE_STR, VALUE_INT, VALUE_FLOAT, VALUE_UNIT = range(5)
+
+def _column_bytes(column):
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes()
+
+def _read_column(f, typecode, count):
+    column = array(typecode)
+    column.frombytes(f.read(column.itemsize * count))
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+class BinaryTokenSink(TokenSink):
+    """Writes a compact columnar dump that read_token_dump() turns back into tokens."""
+
+    def __init__(self, output_file, batch_size=TOKEN_BATCH_SIZE):
+        self.file = open(output_file, 'wb')
+        self.file.write(BINARY_MAGIC)
+        self.batch_size = batch_size
+
+    def write_tokens(self, tokens):
+        batch = []
+        for token in tokens:
+            batch.append(token)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+
+    def write_batch(self, tokens):
+        strings = {}
+        types, refs, lines, columns = array('I'), array('I'), array('I'), array('I')
+        tags = bytearray()
+        floats = array('d')
+        for token in tokens:
+            types.append(strings.setdefault(token.type, len(strings)))
+            value = token.value
+            ref = 0
+            if value is None:
+                tags.append(VALUE_NONE)
+            elif isinstance(value, str):
+                tags.append(VALUE_STR)
+                ref = strings.setdefault(value, len(strings))
+            elif isinstance(value, tuple):
+                tags.append(VALUE_UNIT)
+                floats.append(value[0])
+                ref = strings.setdefault(value[1], len(strings))
+            elif isinstance(value, int):
+                tags.append(VALUE_INT)
+                ref = strings.setdefault(str(value), len(strings))
+            else:
+                tags.append(VALUE_FLOAT)
+                floats.append(value)
+            refs.append(ref)
+            lines.append(token.line)
+            columns.append(token.column)
+
+        encoded = [string.encode('utf-8') for string in strings]
+        lengths = array('I', [len(data) for data in encoded])
+        table = b''.join(encoded)
+        self.file.write(BATCH_HEADER.pack(len(tokens), len(strings), len(floats), len(table)))
+        for column in (types, refs, lines, columns):
+            self.file.write(_column_bytes(column))
+        self.file.write(tags)
+        self.file.write(_column_bytes(floats))
+        self.file.write(_column_bytes(lengths))
+        self.file.write(table)
+
+    def close(self):
+        self.file.close()
+
+def read_token_dump(input_file):
+    """Yield the tokens stored in a BinaryTokenSink dump."""
+    with open(input_file, 'rb') as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{input_file} is not a binary token dump")
+        while True:
+            header = f.read(BATCH_HEADER.size)
+            if not header:
+                return
+            count, string_count, float_count, table_size = BATCH_HEADER.unpack(header)
+            types, refs, lines, columns = [_read_column(f, 'I', count) for _ in range(4)]
+            tags = f.read(count)
+            floats = _read_column(f, 'd', float_count)
+            lengths = _read_column(f, 'I', string_count)
+            table = f.read(table_size)
+            strings = []
+            offset = 0
+            for length in lengths:
+                strings.append(table[offset:offset + length].decode('utf-8'))
+                offset += length
+
+            float_index = 0
+            for i in range(count):
+                tag = tags[i]
+                if tag == VALUE_NONE:
+                    value = None
+                elif tag == VALUE_STR:
+                    value = strings[refs[i]]
+                elif tag == VALUE_INT:
+                    value = int(strings[refs[i]])
+                elif tag == VALUE_FLOAT:
+                    value = floats[float_index]
+                    float_index += 1
+                else:
+                    value = (floats[float_index], strings[refs[i]])
+                    float_index += 1
+                yield Token(strings[types[i]], value, lines[i], columns[i])
+
+def open_token_sink(output):
+    """Return a sink for `output`: None, a text file name, or a TokenSink."""
+    if output is None:
+        return NullTokenSink()
+    if isinstance(output, TokenSink):
+        return output
+    return TextTokenSink(output)
+
+def map_file(input_file):
+    """Memory-map a source file read-only; None for an empty file, which mmap cannot map."""
+    with open(input_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def iter_buffer_tokens(buffer):
+    """Yield the tokens of a UTF-8 bytes buffer (e.g. from map_file()), finishing with the EOF token."""
+    if not buffer:
+        yield Token('EOF', None, 1, 1)
+        return
+    lexer = MappedLexer(buffer)
+    while True:
+        token = lexer.get_next_token()
+        yield token
+        if token.type == 'EOF':
+            return
+
+def iter_file_tokens(input_file):
+    """Yield the tokens of a UTF-8 source file, finishing with the EOF token.
+
+    The file is memory-mapped and lexed in place with MappedLexer instead of
+    being read into a string. The mapping is released once no token (whose
+    line/column may still be looked up) refers to it.
+    """
+    yield from iter_buffer_tokens(map_file(input_file))
+
+def collect_tokens(token_iter, output_file=None):
+    tokens = []
+    try:
+        for token in token_iter:
+            tokens.append(token)
+    except SyntaxError as e:
+        print(e) # Keep printing to console for debugging
+        return str(e) # Return the error message as a string
+    sink = open_token_sink(output_file)
+    try:
+        sink.write_tokens(tokens)
+    finally:
+        if sink is not output_file:
+            sink.close()
+    return tokens
+
+def scan(source_code, output_file=None, engine='regex'):
+    return collect_tokens(iter_tokens(source_code, engine), output_file)
+
+def scan_file(input_file, output_file=None):
+    """Like scan(), but lexes a source file through iter_file_tokens()."""
+    return collect_tokens(iter_file_tokens(input_file), output_file)
@@ -1,5 +1,6 @@
-from lexer import scan
-from parser import parse,print_ast
+from parser import print_ast
+from interpreter import interpret, EvaluationError
+from unit_checker import check_units, UnitCheckError
 
 # if __name__ == '__main__':
 #     input_file = 'input.txt'
@@ -22,19 +23,34 @@ from parser import parse,print_ast
 #         parser.parse(tokens[:-1]) # Exclude the EOF token from parsing
 
 if __name__ == '__main__':
-    from lexer import scan
+    import os
+    import currency
+    from compile_cache import compile_file
     input_file = 'input.txt'
+    rates_file = 'rates.json'
+    if os.path.exists(rates_file):
+        currency.use_provider(currency.FileRateProvider(rates_file)) # Otherwise the built-in rates
     try:
-        with open(input_file, 'r') as f:
-            source_code = f.read()
+        # Tokens and AST come from the on-disk cache when input.txt is unchanged;
+        # otherwise the file is memory-mapped, lexed in place and parsed as a stream
+        tokens, ast = compile_file(input_file, 'token-output.txt')
     except FileNotFoundError:
         print(f"Error: Input file '{input_file}' not found.")
         exit()
-    tokens = scan(source_code, 'token-output.txt')
-    if tokens:
-        ast = parse(tokens[:-1]) # Exclude EOF token
+    if ast is not None:
         print("Parsing successful. Abstract Syntax Tree:")
         print_ast(ast)
+        try:
+            check_units(ast) # Unit errors are reported before anything runs
+        except UnitCheckError as e:
+            for error in e.errors:
+                print(f"Unit error: {error}")
+            exit()
+        print("Program output:")
+        try:
+            interpret(ast)
+        except EvaluationError as e:
+            print(f"Runtime error: {e}")
 
 
 # def print_ast(node, indent=0):
@@ -0,0 +1,419 @@
+from parser import (Program, VariableDeclaration, UnitConversionStatement, PrintStatement,
+                    BinaryOperation, UnitValue, NumberLiteral, Variable, FunctionCall)
+from functions import FUNCTIONS, PURE_FUNCTIONS
+from interpreter import EvaluationError, Quantity, BINARY_OPERATORS, TEMPORARY_PREFIX, convert_quantity, magnitude
+from unit_checker import UnitChecker
+from lexer import value_key
+import currency
+import inspect
+
+def constant_value(node):
+    """Return the runtime value of a literal node, or None if it is not constant."""
+    if node.__class__ is NumberLiteral:
+        return node.value
+    if node.__class__ is UnitValue:
+        return Quantity(node.value, node.unit)
+    return None
+
+def converts_currency(value, target_unit):
+    """True if converting `value` to `target_unit` needs an exchange rate.
+
+    Rates are looked up when the program runs (see currency.use_provider),
+    so these conversions are never done ahead of time.
+    """
+    return (value.__class__ is Quantity and value.unit != target_unit
+            and currency.is_currency_pair(value.unit, target_unit))
+
+def literal(value):
+    """Build the literal node for a folded value, or None if it has no literal form."""
+    if value.__class__ is Quantity:
+        return UnitValue(value.value, value.unit)
+    if value.__class__ in (int, float):
+        return NumberLiteral(value)
+    return None
+
+class ConstantFolder:
+    """Folds constant sub-expressions of a Program ahead of execution.
+
+    Binary operations on literals are evaluated with the interpreter's own
+    arithmetic (so mixed units are normalised exactly as at run time), calls
+    to pure built-ins with literal arguments are pre-evaluated, and constant
+    `convert` operands are converted up front. Anything that would raise is
+    left in place so the error still happens when the statement runs, and
+    currency conversions are left for the rates current at run time.
+    """
+
+    def __init__(self, functions=FUNCTIONS, pure_functions=PURE_FUNCTIONS):
+        self.functions = functions
+        self.pure_functions = pure_functions
+        self.folded_operations = 0
+        self.folded_calls = 0
+        self.folded_conversions = 0
+        self.nodes_removed = 0
+        self.dispatch = {
+            Program: self.fold_program,
+            VariableDeclaration: self.fold_variable_declaration,
+            UnitConversionStatement: self.fold_unit_conversion,
+            PrintStatement: self.fold_print,
+            BinaryOperation: self.fold_binary_operation,
+            FunctionCall: self.fold_function_call,
+        }
+
+    def stats(self):
+        return {
+            'folded_operations': self.folded_operations,
+            'folded_calls': self.folded_calls,
+            'folded_conversions': self.folded_conversions,
+            'nodes_removed': self.nodes_removed,
+        }
+
+    def fold(self, node):
+        handler = self.dispatch.get(node.__class__)
+        return handler(node) if handler is not None else node
+
+    def fold_program(self, node):
+        return Program([self.fold(statement) for statement in node.statements])
+
+    def fold_variable_declaration(self, node):
+        expression = self.fold(node.expression)
+        return node if expression is node.expression else VariableDeclaration(node.name, expression)
+
+    def fold_print(self, node):
+        expression = self.fold(node.expression)
+        return node if expression is node.expression else PrintStatement(expression)
+
+    def fold_unit_conversion(self, node):
+        expression = self.fold(node.expression)
+        value = constant_value(expression)
+        if value.__class__ is Quantity and value.unit != node.target_unit and not converts_currency(value, node.target_unit):
+            try:
+                expression = literal(convert_quantity(value, node.target_unit))
+                self.folded_conversions += 1
+            except (EvaluationError, ArithmeticError):
+                pass
+        if expression is node.expression:
+            return node
+        return UnitConversionStatement(expression, node.target_unit)
+
+    def fold_binary_operation(self, node):
+        left = self.fold(node.left)
+        right = self.fold(node.right)
+        left_value = constant_value(left)
+        right_value = constant_value(right)
+        if (left_value is not None and right_value is not None
+                and not (node.op in ('+', '-') and left_value.__class__ is Quantity
+                         and converts_currency(right_value, left_value.unit))):
+            try:
+                folded = literal(BINARY_OPERATORS[node.op](left_value, right_value))
+            except (EvaluationError, ArithmeticError):
+                folded = None
+            if folded is not None:
+                self.folded_operations += 1
+                self.nodes_removed += 2
+                return folded
+        if left is node.left and right is node.right:
+            return node
+        return BinaryOperation(node.op, left, right)
+
+    def fold_function_call(self, node):
+        args = [self.fold(arg) for arg in node.args]
+        values = [constant_value(arg) for arg in args]
+        function = self.functions.get(node.name)
+        if function is not None and node.name in self.pure_functions and None not in values:
+            try:
+                folded = literal(function(*[magnitude(value) for value in values]))
+            except Exception:
+                # Built-ins raise all sorts of errors; leave those for run time
+                folded = None
+            if folded is not None:
+                self.folded_calls += 1
+                self.nodes_removed += len(args)
+                return folded
+        if all(new is old for new, old in zip(args, node.args)):
+            return node
+        return FunctionCall(node.name, args)
+
+def fold_constants(program, functions=FUNCTIONS):
+    """Return (folded program, statistics) for a Program."""
+    folder = ConstantFolder(functions)
+    return folder.fold(program), folder.stats()
+
+def expression_size(node):
+    """Number of nodes in an expression tree."""
+    return 1 + sum(expression_size(child) for child in expression_children(node))
+
+def expression_children(node):
+    if node.__class__ is BinaryOperation:
+        return (node.left, node.right)
+    if node.__class__ is FunctionCall:
+        return node.args
+    return ()
+
+def variable_reads(node, names):
+    """Add the names of the variables read by an expression to `names`."""
+    if node.__class__ is Variable:
+        names.add(node.name)
+    for child in expression_children(node):
+        variable_reads(child, names)
+    return names
+
+class DeadBindingEliminator:
+    """Removes `let` bindings whose value is never read.
+
+    A binding is dead when no later statement reads it before the name is
+    bound again, counting only reads by statements that are kept, so chains
+    of unused bindings go at once. Names in `keep` (bindings a caller wants
+    from the final environment) always stay live at the end. A dead binding
+    is only removed if evaluating it cannot fail: the unit checker must have
+    typed it, every division must be by a non-zero literal, currency mixing
+    (which needs a rate) is kept, and calls must be to `total` built-ins
+    with the right number of arguments. Otherwise the error it raises at run
+    time is preserved.
+    """
+
+    def __init__(self, functions=FUNCTIONS, keep=()):
+        self.functions = functions
+        self.keep = frozenset(keep)
+        self.types = {}
+        self.failures = {}
+        self.dead_bindings = 0
+        self.nodes_removed = 0
+
+    def stats(self):
+        return {'dead_bindings': self.dead_bindings, 'nodes_removed': self.nodes_removed}
+
+    def may_fail(self, node):
+        """True unless evaluating `node` is known not to raise (needs `types` from the UnitChecker)."""
+        failure = self.failures.get(node)
+        if failure is None:
+            failure = self.failures[node] = self.check_failure(node)
+        return failure
+
+    def check_failure(self, node):
+        if node not in self.types:
+            return True
+        kind = node.__class__
+        if kind is BinaryOperation:
+            if self.may_fail(node.left) or self.may_fail(node.right):
+                return True
+            if node.op == '/':
+                right = constant_value(node.right)
+                return right is None or magnitude(right) == 0
+            if node.op in ('+', '-'):
+                left_unit = self.types[node.left][0]
+                right_unit = self.types[node.right][0]
+                return (left_unit is not None and right_unit is not None and left_unit != right_unit
+                        and currency.is_currency_pair(left_unit, right_unit))
+            return False
+        if kind is FunctionCall:
+            function = self.functions.get(node.name)
+            if function is None or not getattr(function, 'total', False):
+                return True
+            try:
+                inspect.signature(function).bind(*node.args)
+            except (TypeError, ValueError):
+                return True
+            return any(self.may_fail(arg) for arg in node.args)
+        return False
+
+    def eliminate(self, program):
+        checker = UnitChecker(self.functions)
+        checker.check(program)
+        self.types = checker.types
+        live = set(self.keep)
+        kept = []
+        # Backwards, so `live` holds the names a later kept statement reads
+        for statement in reversed(program.statements):
+            if statement.__class__ is VariableDeclaration:
+                if statement.name not in live and not self.may_fail(statement.expression):
+                    self.dead_bindings += 1
+                    self.nodes_removed += 1 + expression_size(statement.expression)
+                    continue
+                live.discard(statement.name)
+                variable_reads(statement.expression, live)
+            elif statement.__class__ in (UnitConversionStatement, PrintStatement):
+                variable_reads(statement.expression, live)
+            else:
+                variable_reads(statement, live)
+            kept.append(statement)
+        self.types = {}
+        self.failures = {}
+        if len(kept) == len(program.statements):
+            return program
+        kept.reverse()
+        return Program(kept)
+
+class CommonSubexpressionEliminator:
+    """Computes each repeated pure sub-expression once.
+
+    Expressions get value numbers: two sub-trees share a number when they
+    have the same operator or pure built-in and the same operand numbers,
+    and variables are numbered per binding, so `x + 1` before and after
+    `let x = ...` differ. Every BinaryOperation or pure FunctionCall that
+    occurs more than once is bound to a temporary (named `$cse0`, `$cse1`,
+    ... so it cannot clash with a script's names) by a `let` inserted
+    before the statement where it first occurs, and later occurrences read
+    the temporary. Hoisting moves the expression ahead of the rest of its
+    statement, so it is only done when nothing evaluated before it in the
+    statement can fail (see DeadBindingEliminator.may_fail); otherwise the
+    next occurrence is tried, and errors stay exactly as before.
+    Evaluators leave temporaries out of the final bindings (see
+    interpreter.final_bindings).
+    """
+
+    def __init__(self, functions=FUNCTIONS, pure_functions=PURE_FUNCTIONS):
+        self.functions = functions
+        self.pure_functions = pure_functions
+        self.failures = DeadBindingEliminator(functions)
+        self.pending_failure = False # Something left in the statement, before this point, may raise
+        self.numbers = {}
+        self.table = {}
+        self.versions = {}
+        self.counts = {}
+        self.temporaries = {}
+        self.uses = {}
+        self.shared_subexpressions = 0
+        self.nodes_removed = 0
+
+    def stats(self):
+        return {
+            'shared_subexpressions': self.shared_subexpressions,
+            'temporaries': sum(1 for uses in self.uses.values() if uses > 1),
+            'nodes_removed': self.nodes_removed,
+        }
+
+    def number(self, node):
+        """Value-number an expression (and its sub-expressions); returns its number."""
+        kind = node.__class__
+        if kind is NumberLiteral:
+            key = ('number', value_key(node.value))
+        elif kind is UnitValue:
+            key = ('unit', value_key(node.value), node.unit)
+        elif kind is Variable:
+            key = ('variable', node.name, self.versions.get(node.name, 0))
+        elif kind is BinaryOperation:
+            key = (node.op, self.number(node.left), self.number(node.right))
+        else:
+            args = tuple(self.number(arg) for arg in node.args)
+            # Impure or unknown calls never match anything
+            key = ('call', node.name, args) if node.name in self.pure_functions else ('call', node)
+        number = self.table.get(key)
+        if number is None:
+            number = self.table[key] = len(self.table)
+        self.numbers[node] = number
+        if kind is BinaryOperation or kind is FunctionCall:
+            self.counts[number] = self.counts.get(number, 0) + 1
+        return number
+
+    def rewrite(self, node, lets):
+        number = self.numbers[node]
+        if self.counts.get(number, 0) > 1:
+            name = self.temporaries.get(number)
+            if name is not None:
+                # An earlier occurrence already computed it without raising
+                self.uses[name] += 1
+                self.shared_subexpressions += 1
+                self.nodes_removed += expression_size(node) - 1
+                return Variable(name)
+            if not self.pending_failure:
+                name = f"{TEMPORARY_PREFIX}cse{len(self.temporaries)}"
+                self.temporaries[number] = name
+                self.uses[name] = 1
+                lets.append(VariableDeclaration(name, self.rewrite_children(node, lets)))
+                # Whatever might raise inside it now runs in its own `let`, in order
+                self.pending_failure = False
+                return Variable(name)
+        rewritten = self.rewrite_children(node, lets)
+        if not self.pending_failure:
+            self.pending_failure = self.failures.may_fail(node)
+        return rewritten
+
+    def rewrite_children(self, node, lets):
+        if node.__class__ is BinaryOperation:
+            left = self.rewrite(node.left, lets)
+            right = self.rewrite(node.right, lets)
+            if left is node.left and right is node.right:
+                return node
+            return BinaryOperation(node.op, left, right)
+        if node.__class__ is FunctionCall:
+            args = [self.rewrite(arg, lets) for arg in node.args]
+            if all(new is old for new, old in zip(args, node.args)):
+                return node
+            return FunctionCall(node.name, args)
+        return node
+
+    def eliminate(self, program):
+        for statement in program.statements:
+            expression = getattr(statement, 'expression', statement)
+            self.number(expression)
+            if statement.__class__ is VariableDeclaration:
+                self.versions[statement.name] = self.versions.get(statement.name, 0) + 1
+        if all(count == 1 for count in self.counts.values()):
+            return program
+
+        checker = UnitChecker(self.functions)
+        checker.check(program)
+        self.failures.types = checker.types
+        statements = []
+        for statement in program.statements:
+            lets = []
+            self.pending_failure = False
+            if statement.__class__ is VariableDeclaration:
+                statement = VariableDeclaration(statement.name, self.rewrite(statement.expression, lets))
+            elif statement.__class__ is UnitConversionStatement:
+                statement = UnitConversionStatement(self.rewrite(statement.expression, lets), statement.target_unit)
+            elif statement.__class__ is PrintStatement:
+                statement = PrintStatement(self.rewrite(statement.expression, lets))
+            else:
+                statement = self.rewrite(statement, lets)
+            statements.extend(lets)
+            statements.append(statement)
+        self.failures.types = {}
+        self.failures.failures = {}
+        return Program(self.inline_single_uses(statements))
+
+    def inline_single_uses(self, statements):
+        # A temporary read only once (its other occurrences were all inside a
+        # larger shared expression) is put back where it was used
+        definitions = {}
+        result = []
+        for statement in statements:
+            if statement.__class__ is VariableDeclaration and self.uses.get(statement.name) == 1:
+                definitions[statement.name] = self.inline(statement.expression, definitions)
+            elif not definitions:
+                result.append(statement)
+            elif statement.__class__ is VariableDeclaration:
+                result.append(VariableDeclaration(statement.name, self.inline(statement.expression, definitions)))
+            elif statement.__class__ is UnitConversionStatement:
+                result.append(UnitConversionStatement(self.inline(statement.expression, definitions), statement.target_unit))
+            elif statement.__class__ is PrintStatement:
+                result.append(PrintStatement(self.inline(statement.expression, definitions)))
+            else:
+                result.append(self.inline(statement, definitions))
+        return result
+
+    def inline(self, node, definitions):
+        if node.__class__ is Variable:
+            return definitions.get(node.name, node)
+        if node.__class__ is BinaryOperation:
+            left = self.inline(node.left, definitions)
+            right = self.inline(node.right, definitions)
+            if left is node.left and right is node.right:
+                return node
+            return BinaryOperation(node.op, left, right)
+        if node.__class__ is FunctionCall:
+            args = [self.inline(arg, definitions) for arg in node.args]
+            if all(new is old for new, old in zip(args, node.args)):
+                return node
+            return FunctionCall(node.name, args)
+        return node
+
+def eliminate_dead_bindings(program, functions=FUNCTIONS, keep=()):
+    """Return (program without unused bindings, statistics)."""
+    eliminator = DeadBindingEliminator(functions, keep)
+    return eliminator.eliminate(program), eliminator.stats()
+
+def eliminate_common_subexpressions(program, functions=FUNCTIONS):
+    """Return (program computing each repeated pure sub-expression once, statistics)."""
+    eliminator = CommonSubexpressionEliminator(functions)
+    return eliminator.eliminate(program), eliminator.stats()
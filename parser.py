@@ -1,11 +1,16 @@
 import re
-from lexer import Token, Lexer
+from array import array
+from collections import deque
+from lexer import Token, Lexer, LexicalError, value_key
+from units import REGISTRY
 
 # Abstract Syntax Tree Node Classes
 class ASTNode:
-    pass
+    __slots__ = ()
 
 class Program(ASTNode):
+    __slots__ = ('statements',)
+
     def __init__(self, statements):
         self.statements = statements
 
@@ -13,9 +18,11 @@ class Program(ASTNode):
         return f"Program(statements={self.statements})"
 
 class Statement(ASTNode):
-    pass
+    __slots__ = ()
 
 class VariableDeclaration(Statement):
+    __slots__ = ('name', 'expression')
+
     def __init__(self, name, expression):
         self.name = name
         self.expression = expression
@@ -24,6 +31,8 @@ class VariableDeclaration(Statement):
         return f"VariableDeclaration(name='{self.name}', expression={self.expression})"
 
 class UnitConversionStatement(Statement):
+    __slots__ = ('expression', 'target_unit')
+
     def __init__(self, expression, target_unit):
         self.expression = expression
         self.target_unit = target_unit
@@ -32,6 +41,8 @@ class UnitConversionStatement(Statement):
         return f"UnitConversionStatement(expression={self.expression}, target_unit='{self.target_unit}')"
 
 class PrintStatement(Statement):
+    __slots__ = ('expression',)
+
     def __init__(self, expression):
         self.expression = expression
 
@@ -39,9 +50,11 @@ class PrintStatement(Statement):
         return f"PrintStatement(expression={self.expression})"
 
 class Expression(ASTNode):
-    pass
+    __slots__ = ()
 
 class BinaryOperation(Expression):
+    __slots__ = ('op', 'left', 'right')
+
     def __init__(self, op, left, right):
         self.op = op
         self.left = left
@@ -51,6 +64,8 @@ class BinaryOperation(Expression):
         return f"BinaryOperation(op='{self.op}', left={self.left}, right={self.right})"
 
 class UnitValue(Expression):
+    __slots__ = ('value', 'unit')
+
     def __init__(self, value, unit):
         self.value = value
         self.unit = unit
@@ -59,6 +74,8 @@ class UnitValue(Expression):
         return f"UnitValue(value={self.value}, unit='{self.unit}')"
 
 class NumberLiteral(Expression):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
@@ -66,6 +83,8 @@ class NumberLiteral(Expression):
         return f"NumberLiteral(value={self.value})"
 
 class Variable(Expression):
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
@@ -73,6 +92,8 @@ class Variable(Expression):
         return f"Variable(name='{self.name}')"
 
 class FunctionCall(Expression):
+    __slots__ = ('name', 'args')
+
     def __init__(self, name, args):
         self.name = name
         self.args = args
@@ -80,17 +101,72 @@ class FunctionCall(Expression):
     def __repr__(self):
         return f"FunctionCall(name='{self.name}', args={self.args})"
 
+class TreeBuilder:
+    """Default node factory for Parser: builds the node classes above."""
+    Program = Program
+    VariableDeclaration = VariableDeclaration
+    UnitConversionStatement = UnitConversionStatement
+    PrintStatement = PrintStatement
+    BinaryOperation = BinaryOperation
+    UnitValue = UnitValue
+    NumberLiteral = NumberLiteral
+    Variable = Variable
+    FunctionCall = FunctionCall
+
+class BinaryOperator:
+    """An entry in the binary operator table used by Parser.expression.
+
+    Operators with a higher `power` bind tighter. A right-associative
+    operator (such as a future '^') leaves stacked operators of the same
+    power for later, so 2 ^ 3 ^ 2 groups as 2 ^ (3 ^ 2).
+    """
+    __slots__ = ('symbol', 'power', 'reduce_power')
+
+    def __init__(self, symbol, power, right_associative=False):
+        self.symbol = symbol
+        self.power = power
+        # Stacked operators with at least this power are built first
+        self.reduce_power = power + 1 if right_associative else power
+
+class OpenCall:
+    """Operator stack marker for a function call whose ')' has not been read yet."""
+    __slots__ = ('power', 'name', 'args')
+
+    def __init__(self, name):
+        self.power = OPEN
+        self.name = name
+        self.args = []
+
+# Binding powers of the operator stack markers: OPEN for '(' and calls, below
+# every operator, and BOTTOM for the start of the expression
+OPEN = -1
+PAREN = BinaryOperator('(', OPEN)
+BOTTOM = BinaryOperator(None, -2)
+
+# Symbol -> BinaryOperator. A new operator only needs an entry here (or in a
+# Parser subclass's binary_operators) and a lexer rule producing it.
+BINARY_PRECEDENCE = {
+    '+': BinaryOperator('+', 10),
+    '-': BinaryOperator('-', 10),
+    '*': BinaryOperator('*', 20),
+    '/': BinaryOperator('/', 20),
+}
+
 class Parser:
-    def __init__(self, tokens):
+    binary_operators = BINARY_PRECEDENCE
+
+    def __init__(self, tokens, builder=TreeBuilder):
+        self.build = builder
         self.tokens = tokens
         self.position = 0
         self.current_token = self.tokens[self.position] if self.tokens else None
+        self.errors = []  # messages of the syntax errors recovered from
 
     def advance(self):
         self.position += 1
-        if self.position < len(self.tokens):
+        try:
             self.current_token = self.tokens[self.position]
-        else:
+        except IndexError:
             self.current_token = None
 
     def peek(self, offset=1):
@@ -99,6 +175,9 @@ class Parser:
             return self.tokens[peek_position]
         return None
 
+    def last_token(self):
+        return self.tokens[-1] if self.tokens else None
+
     def eat(self, token_type, token_value=None):
         if self.current_token is not None and self.current_token.type == token_type and (token_value is None or self.current_token.value == token_value):
             self.advance()
@@ -107,9 +186,10 @@ class Parser:
             found = f"'{self.current_token.value}' ({self.current_token.type})" if self.current_token else 'EOF'
             self.error(f"Expected {expected}, but found {found}")
 
-    def error(self, message):
-        if self.current_token:
-            raise SyntaxError(f"Parsing error at line {self.current_token.line}, column {self.current_token.column}: {message}")
+    def error(self, message, token=None):
+        token = token or self.current_token
+        if token:
+            raise SyntaxError(f"Parsing error at line {token.line}, column {token.column}: {message}")
         else:
             raise SyntaxError(f"Parsing error at end of input: {message}")
 
@@ -119,12 +199,15 @@ class Parser:
         while self.current_token is not None and self.current_token.type != 'EOF':
             try:
                 statement = self.statement()
-                if statement:
+                if statement is not None:
                     statements.append(statement)
                 if self.current_token is not None and self.current_token.type != 'EOF':
                     self.eat('SEMICOLON')
+            except LexicalError:
+                raise
             except SyntaxError as e:
                 print(e)
+                self.errors.append(str(e))
                 # Attempt to recover by skipping to the next semicolon or end of file
                 while self.current_token is not None and self.current_token.type != 'SEMICOLON' and self.current_token.type != 'EOF':
                     self.advance()
@@ -132,11 +215,11 @@ class Parser:
                     self.advance()
                 # raise SyntaxError(str(e))
 
-        if statements and self.tokens and self.tokens[-1].type != 'EOF' and self.tokens[-1].type != 'SEMICOLON':
-            last_token = self.tokens[-1]
+        last_token = self.last_token()
+        if statements and last_token and last_token.type != 'EOF' and last_token.type != 'SEMICOLON':
             raise SyntaxError(f"Parsing error at line {last_token.line}, column {last_token.column + len(str(last_token.value))}: Expected ';'")
 
-        return Program(statements)
+        return self.build.Program(statements)
 
     def statement(self):
         if self.current_token.type == 'KEYWORD' and self.current_token.value == 'let':
@@ -154,7 +237,7 @@ class Parser:
         self.eat('IDENTIFIER')
         self.eat('OPERATOR', '=')
         expression = self.expression()
-        return VariableDeclaration(name, expression)
+        return self.build.VariableDeclaration(name, expression)
 
     def unit_conversion_statement(self):
         self.eat('KEYWORD', 'convert')
@@ -162,83 +245,335 @@ class Parser:
         expression = self.expression()
         self.eat('RPAREN')
         self.eat('KEYWORD', 'to')
-        target_unit = self.current_token.value
-        self.eat('IDENTIFIER')
-        return UnitConversionStatement(expression, target_unit)
+        target_token = self.current_token
+        # Lexed as a UNIT token, spelled as in unit values (°C, m^2, km/h)
+        self.eat('UNIT')
+        target_unit = target_token.value
+        # A compound target written with spaces (km / h) continues as OPERATOR IDENTIFIER
+        while (self.current_token is not None and self.current_token.type == 'OPERATOR' and self.current_token.value in ['*', '/']
+               and self.peek() is not None and self.peek().type == 'IDENTIFIER'):
+            target_unit += self.current_token.value + self.peek().value
+            self.advance()
+            self.advance()
+        if target_unit not in REGISTRY:
+            self.error(f"Unknown unit: {target_unit}", target_token)
+        return self.build.UnitConversionStatement(expression, target_unit)
 
     def print_statement(self):
         self.eat('KEYWORD', 'print')
         expression = self.expression()
-        return PrintStatement(expression)
+        return self.build.PrintStatement(expression)
 
     def expression_statement(self):
         return self.expression() # For cases like function calls without 'let'
 
     def expression(self):
-        return self.additive_expression()
-
-    def additive_expression(self):
-        left = self.multiplicative_expression()
-        while self.current_token is not None and self.current_token.type == 'OPERATOR' and self.current_token.value in ['+', '-']:
-            op = self.current_token.value
-            self.advance()
-            right = self.multiplicative_expression()
-            left = BinaryOperation(op, left, right)
-        return left
-
-    def multiplicative_expression(self):
-        left = self.factor()
-        while self.current_token is not None and self.current_token.type == 'OPERATOR' and self.current_token.value in ['*', '/']:
-            op = self.current_token.value
-            self.advance()
-            right = self.factor()
-            left = BinaryOperation(op, left, right)
-        return left
-
-    def factor(self):
-        if self.current_token is not None and self.current_token.type == 'LPAREN':
-            self.eat('LPAREN')
-            expression = self.expression()
-            self.eat('RPAREN')
-            return expression
-        elif self.current_token is not None and self.current_token.type == 'NUMBER':
+        """Parse an expression with an explicit operator stack (precedence climbing).
+
+        Operands are built as they are read and each operator is reduced once
+        an operator that binds no tighter follows it, so nodes come out in the
+        same order and shape as a recursive-descent parse. Parentheses and
+        call arguments only push a marker on the stack, so nesting depth costs
+        no Python frames. Binary operators and their binding power come from
+        `binary_operators`.
+        """
+        build = self.build
+        BinaryOperation = build.BinaryOperation
+        binary_operators = self.binary_operators
+        advance = self.advance
+        # Each stacked operator (or open '(' / call marker) sits above its left operand
+        stack = [BOTTOM]
+        lefts = []
+
+        while True:
+            # An operand, after any number of '(' and open calls
             token = self.current_token
-            self.eat('NUMBER')
-            if self.current_token is not None and self.current_token.type == 'UNIT':
+            token_type = token.type if token is not None else None
+            if token_type == 'NUMBER':
+                advance()
                 unit_token = self.current_token
-                self.eat('UNIT')
-                return UnitValue(token.value, unit_token.value)
-            return NumberLiteral(token.value)
-        elif self.current_token is not None and self.current_token.type == 'UNIT_VALUE':
-            token = self.current_token
-            self.eat('UNIT_VALUE')
-            return UnitValue(token.value[0], token.value[1])
-        elif self.current_token is not None and self.current_token.type == 'IDENTIFIER':
-            if self.peek() is not None and self.peek().type == 'LPAREN':
-                return self.function_call()
+                if unit_token is not None and unit_token.type == 'UNIT':
+                    operand = build.UnitValue(token.value, unit_token.value)
+                    advance()
+                else:
+                    operand = build.NumberLiteral(token.value)
+            elif token_type == 'UNIT_VALUE':
+                advance()
+                operand = build.UnitValue(token.value[0], token.value[1])
+            elif token_type == 'LPAREN':
+                stack.append(PAREN)
+                lefts.append(None)
+                advance()
+                continue
+            elif token_type == 'FUNCTION' or (token_type == 'IDENTIFIER' and self.peek() is not None and self.peek().type == 'LPAREN'):
+                self.eat('FUNCTION')
+                self.eat('LPAREN')
+                if self.current_token is not None and self.current_token.type == 'RPAREN':
+                    advance()
+                    operand = build.FunctionCall(token.value, [])
+                else:
+                    stack.append(OpenCall(token.value))
+                    lefts.append(None)
+                    continue
+            elif token_type == 'IDENTIFIER':
+                advance()
+                operand = build.Variable(token.value)
             else:
+                self.error("Unexpected token in expression.")
+
+            # Then operators, and the ')' or ',' closing groups and calls
+            while True:
                 token = self.current_token
-                self.eat('IDENTIFIER')
-                return Variable(token.value)
-        elif self.current_token is not None and self.current_token.type == 'FUNCTION':
-            return self.function_call()
-        else:
-            self.error("Unexpected token in expression.")
+                operator = binary_operators.get(token.value) if token is not None and token.type == 'OPERATOR' else None
+                if operator is not None:
+                    # Build the stacked operators that bind at least as tightly
+                    power = operator.reduce_power
+                    while stack[-1].power >= power:
+                        operand = BinaryOperation(stack.pop().symbol, lefts.pop(), operand)
+                    stack.append(operator)
+                    lefts.append(operand)
+                    advance()
+                    break
+                while stack[-1].power > OPEN:
+                    operand = BinaryOperation(stack.pop().symbol, lefts.pop(), operand)
+                marker = stack[-1]
+                if marker is BOTTOM:
+                    return operand
+                token_type = token.type if token is not None else None
+                if token_type == 'RPAREN':
+                    stack.pop()
+                    lefts.pop()
+                    advance()
+                    if marker is not PAREN:
+                        marker.args.append(operand)
+                        operand = build.FunctionCall(marker.name, marker.args)
+                elif token_type == 'COMMA' and marker is not PAREN:
+                    marker.args.append(operand)
+                    advance()
+                    break
+                else:
+                    # An unclosed '(' or call
+                    self.eat('RPAREN')
+
+class StreamingParser(Parser):
+    """Parser that pulls tokens lazily from an iterator (e.g. lexer.iter_tokens).
+
+    Only the tokens needed for lookahead are buffered, so memory use does not
+    depend on the length of the script. An EOF token ends the stream, which
+    parses exactly like passing scan(...)[:-1] to Parser.
+    """
+
+    def __init__(self, tokens, builder=TreeBuilder):
+        self.build = builder
+        self.tokens = iter(tokens)
+        self.lookahead = deque()
+        self.final_token = None
+        self.position = 0
+        self.errors = []
+        self.current_token = self.pull()
 
-    def function_call(self):
-        name = self.current_token.value
-        self.eat('FUNCTION')
-        self.eat('LPAREN')
-        args =[]
-        if self.current_token.type != 'RPAREN':
-            args.append(self.expression())
-            while self.current_token is not None and self.current_token.type == 'COMMA':
-                self.eat('COMMA')
-                args.append(self.expression())
-        self.eat('RPAREN')
-        return FunctionCall(name, args)
+    def pull(self):
+        token = next(self.tokens, None)
+        if token is None or token.type == 'EOF':
+            return None
+        self.final_token = token
+        return token
 
+    def advance(self):
+        self.position += 1
+        self.current_token = self.lookahead.popleft() if self.lookahead else self.pull()
 
+    def peek(self, offset=1):
+        while len(self.lookahead) < offset:
+            token = self.pull()
+            if token is None:
+                return None
+            self.lookahead.append(token)
+        return self.lookahead[offset - 1]
+
+    def last_token(self):
+        return self.final_token
+
+
+# Flat AST representation. Node kinds index NODE_TYPES.
+NODE_TYPES = (Program, VariableDeclaration, UnitConversionStatement, PrintStatement,
+              BinaryOperation, UnitValue, NumberLiteral, Variable, FunctionCall)
+(PROGRAM, VARIABLE_DECLARATION, UNIT_CONVERSION, PRINT, BINARY_OPERATION,
+ UNIT_VALUE, NUMBER_LITERAL, VARIABLE, FUNCTION_CALL) = range(len(NODE_TYPES))
+
+def node_type(node):
+    """Return the class in NODE_TYPES that `node` is an instance of.
+
+    Subclasses, such as the slot-resolved nodes of resolver.py, map to the
+    node class they extend.
+    """
+    kind = node.__class__
+    if kind in NODE_TYPES:
+        return kind
+    return next(base for base in kind.__mro__ if base in NODE_TYPES)
+
+class ASTArena:
+    """AST stored as one row per node in parallel `array` columns.
+
+    kinds[i] is the node kind; the a/b/c columns hold child node indexes,
+    value-table ids (names, units, numbers, operators) or spans of the shared
+    `children` column, depending on the kind:
+
+        Program                  a, b = children start, count
+        VariableDeclaration      a = name id, b = expression
+        UnitConversionStatement  a = expression, b = target unit id
+        PrintStatement           a = expression
+        BinaryOperation          a = op id, b = left, c = right
+        UnitValue                a = value id, b = unit id
+        NumberLiteral            a = value id
+        Variable                 a = name id
+        FunctionCall             a = name id, b, c = children start, count
+
+    Children always get lower indexes than their parents. The builder methods
+    are named after the node classes, so an arena can be given to Parser in
+    place of TreeBuilder.
+    """
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.a = array('I')
+        self.b = array('I')
+        self.c = array('I')
+        self.children = array('I')
+        self.values = []
+        self.value_index = {}
+        self.root = None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def value_id(self, value):
+        key = value_key(value)
+        value_id = self.value_index.get(key)
+        if value_id is None:
+            value_id = self.value_index[key] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+    def add(self, kind, a=0, b=0, c=0):
+        self.kinds.append(kind)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+        return len(self.kinds) - 1
+
+    def add_children(self, nodes):
+        start = len(self.children)
+        self.children.extend(nodes)
+        return start
+
+    def Program(self, statements):
+        self.root = self.add(PROGRAM, self.add_children(statements), len(statements))
+        return self.root
+
+    def VariableDeclaration(self, name, expression):
+        return self.add(VARIABLE_DECLARATION, self.value_id(name), expression)
+
+    def UnitConversionStatement(self, expression, target_unit):
+        return self.add(UNIT_CONVERSION, expression, self.value_id(target_unit))
+
+    def PrintStatement(self, expression):
+        return self.add(PRINT, expression)
+
+    def BinaryOperation(self, op, left, right):
+        return self.add(BINARY_OPERATION, self.value_id(op), left, right)
+
+    def UnitValue(self, value, unit):
+        return self.add(UNIT_VALUE, self.value_id(value), self.value_id(unit))
+
+    def NumberLiteral(self, value):
+        return self.add(NUMBER_LITERAL, self.value_id(value))
+
+    def Variable(self, name):
+        return self.add(VARIABLE, self.value_id(name))
+
+    def FunctionCall(self, name, args):
+        return self.add(FUNCTION_CALL, self.value_id(name), self.add_children(args), len(args))
+
+    @classmethod
+    def from_tree(cls, root):
+        """Flatten a node tree (normally a Program) into a new arena."""
+        arena = cls()
+        built = {}
+        # Iterative post-order walk, so deep trees do not hit the recursion limit
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(ast_children(node)))
+                continue
+            kind = node_type(node)
+            if kind is Program:
+                index = arena.Program([built[id(child)] for child in node.statements])
+            elif kind is VariableDeclaration:
+                index = arena.VariableDeclaration(node.name, built[id(node.expression)])
+            elif kind is UnitConversionStatement:
+                index = arena.UnitConversionStatement(built[id(node.expression)], node.target_unit)
+            elif kind is PrintStatement:
+                index = arena.PrintStatement(built[id(node.expression)])
+            elif kind is BinaryOperation:
+                index = arena.BinaryOperation(node.op, built[id(node.left)], built[id(node.right)])
+            elif kind is UnitValue:
+                index = arena.UnitValue(node.value, node.unit)
+            elif kind is NumberLiteral:
+                index = arena.NumberLiteral(node.value)
+            elif kind is Variable:
+                index = arena.Variable(node.name)
+            else:
+                index = arena.FunctionCall(node.name, [built[id(arg)] for arg in node.args])
+            built[id(node)] = index
+        arena.root = built[id(root)]
+        return arena
+
+    def to_tree(self, index=None):
+        """Rebuild node objects for the subtree at `index` (default: the root)."""
+        if index is None:
+            index = self.root if self.root is not None else len(self.kinds) - 1
+        kinds, a, b, c = self.kinds, self.a, self.b, self.c
+        children, values = self.children, self.values
+        nodes = []
+        # Children precede their parents, so one forward pass builds every node
+        for i in range(index + 1):
+            kind = kinds[i]
+            if kind == PROGRAM:
+                node = Program([nodes[child] for child in children[a[i]:a[i] + b[i]]])
+            elif kind == VARIABLE_DECLARATION:
+                node = VariableDeclaration(values[a[i]], nodes[b[i]])
+            elif kind == UNIT_CONVERSION:
+                node = UnitConversionStatement(nodes[a[i]], values[b[i]])
+            elif kind == PRINT:
+                node = PrintStatement(nodes[a[i]])
+            elif kind == BINARY_OPERATION:
+                node = BinaryOperation(values[a[i]], nodes[b[i]], nodes[c[i]])
+            elif kind == UNIT_VALUE:
+                node = UnitValue(values[a[i]], values[b[i]])
+            elif kind == NUMBER_LITERAL:
+                node = NumberLiteral(values[a[i]])
+            elif kind == VARIABLE:
+                node = Variable(values[a[i]])
+            else:
+                node = FunctionCall(values[a[i]], [nodes[child] for child in children[b[i]:b[i] + c[i]]])
+            nodes.append(node)
+        return nodes[index]
+
+def ast_children(node):
+    """Return the child nodes of `node`, in source order."""
+    kind = node_type(node)
+    if kind is Program:
+        return node.statements
+    elif kind is BinaryOperation:
+        return [node.left, node.right]
+    elif kind is FunctionCall:
+        return node.args
+    elif kind in (VariableDeclaration, UnitConversionStatement, PrintStatement):
+        return [node.expression]
+    return []
 
 def print_ast(node, indent=0):
     with open("ast_output.txt",'a') as f:
@@ -271,9 +606,16 @@ def print_ast(node, indent=0):
             print_ast(arg, indent + 2)
 
             
-def parse(tokens):
-    parser = Parser(tokens)
-    return parser.parse()
+def parse(tokens, arena=False):
+    """Parse tokens into a Program, or into an ASTArena if `arena` is true."""
+    builder = ASTArena() if arena else TreeBuilder
+    # Iterators (such as lexer.iter_tokens) are parsed as a stream
+    if iter(tokens) is tokens:
+        program = StreamingParser(tokens, builder).parse()
+    else:
+        parser = Parser(tokens, builder)
+        program = parser.parse()
+    return builder if arena else program
 
 # if __name__ == '__main__':
 #     from lexer import scan
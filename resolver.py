@@ -0,0 +1,150 @@
+from parser import (Program, VariableDeclaration, UnitConversionStatement, PrintStatement,
+                    BinaryOperation, UnitValue, NumberLiteral, Variable, FunctionCall)
+
+class ResolveError(Exception):
+    """Raised by resolve_variables with every use-before-definition found."""
+
+    def __init__(self, errors):
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+class SymbolTable:
+    """Dense slot numbers for the variables of one program, in order of first definition."""
+
+    def __init__(self, inputs=()):
+        self.names = []
+        self.slots = {}
+        self.inputs = tuple(inputs)
+        for name in self.inputs:
+            self.define(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.slots
+
+    def define(self, name):
+        # Rebinding a name reuses its slot, as it replaces the dict entry
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.names)
+            self.names.append(name)
+        return slot
+
+    def bindings(self, frame):
+        """Return {name: value} for a frame produced by running the program."""
+        return dict(zip(self.names, frame))
+
+# Resolved nodes. They keep their names, so printing and error messages are
+# unchanged. Every evaluator (interpreter, closure_compiler, bytecode, codegen),
+# unit_checker and ASTArena accept them; only closure_compiler uses the slots.
+# The optimizer and scheduler passes match exact node classes, so run them
+# before resolving.
+class LocalVariable(Variable):
+    __slots__ = ('slot',)
+
+    def __init__(self, name, slot):
+        super().__init__(name)
+        self.slot = slot
+
+    def __repr__(self):
+        return f"LocalVariable(name='{self.name}', slot={self.slot})"
+
+class LocalDeclaration(VariableDeclaration):
+    __slots__ = ('slot',)
+
+    def __init__(self, name, slot, expression):
+        super().__init__(name, expression)
+        self.slot = slot
+
+    def __repr__(self):
+        return f"LocalDeclaration(name='{self.name}', slot={self.slot}, expression={self.expression})"
+
+class ResolvedProgram(Program):
+    __slots__ = ('symbols',)
+
+    def __init__(self, statements, symbols):
+        super().__init__(statements)
+        self.symbols = symbols
+
+    def __repr__(self):
+        return f"ResolvedProgram(statements={self.statements}, slots={len(self.symbols)})"
+
+class Resolver:
+    """Assigns every `let` binding a slot and rewrites variable references to it.
+
+    Programs are straight-line code, so a reference is valid exactly when a
+    `let` for its name (or an input) comes before it. Other references are
+    reported in `errors`; a program that resolves cleanly can run in a flat
+    list frame (see closure_compiler) with no lookups by name.
+    """
+
+    def __init__(self, inputs=()):
+        self.symbols = SymbolTable(inputs)
+        self.errors = []
+        self.dispatch = {
+            Program: self.resolve_program,
+            VariableDeclaration: self.resolve_variable_declaration,
+            UnitConversionStatement: self.resolve_unit_conversion,
+            PrintStatement: self.resolve_print,
+            BinaryOperation: self.resolve_binary_operation,
+            UnitValue: self.resolve_leaf,
+            NumberLiteral: self.resolve_leaf,
+            Variable: self.resolve_variable,
+            FunctionCall: self.resolve_function_call,
+        }
+
+    def resolve(self, node):
+        return self.dispatch[node.__class__](node)
+
+    def resolve_program(self, node):
+        return ResolvedProgram([self.resolve(statement) for statement in node.statements], self.symbols)
+
+    def resolve_variable_declaration(self, node):
+        # The expression is resolved first: in `let x = x + 1` the x read is the old one
+        expression = self.resolve(node.expression)
+        return LocalDeclaration(node.name, self.symbols.define(node.name), expression)
+
+    def resolve_unit_conversion(self, node):
+        expression = self.resolve(node.expression)
+        return node if expression is node.expression else UnitConversionStatement(expression, node.target_unit)
+
+    def resolve_print(self, node):
+        expression = self.resolve(node.expression)
+        return node if expression is node.expression else PrintStatement(expression)
+
+    def resolve_binary_operation(self, node):
+        left = self.resolve(node.left)
+        right = self.resolve(node.right)
+        if left is node.left and right is node.right:
+            return node
+        return BinaryOperation(node.op, left, right)
+
+    def resolve_leaf(self, node):
+        return node
+
+    def resolve_variable(self, node):
+        slot = self.symbols.slots.get(node.name)
+        if slot is None:
+            self.errors.append(f"Undefined variable: {node.name}")
+            return node
+        return LocalVariable(node.name, slot)
+
+    def resolve_function_call(self, node):
+        args = [self.resolve(arg) for arg in node.args]
+        if all(new is old for new, old in zip(args, node.args)):
+            return node
+        return FunctionCall(node.name, args)
+
+def resolve_variables(program, inputs=()):
+    """Return `program` as a ResolvedProgram with slot-indexed variables.
+
+    `inputs` names variables supplied when the program is run. Raises
+    ResolveError listing every variable used before it is defined.
+    """
+    resolver = Resolver(inputs)
+    resolved = resolver.resolve(program)
+    if resolver.errors:
+        raise ResolveError(resolver.errors)
+    return resolved
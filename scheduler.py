@@ -0,0 +1,143 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from parser import VariableDeclaration, UnitConversionStatement, PrintStatement
+from interpreter import Interpreter, final_bindings
+from optimizer import variable_reads
+
+CHUNKS_PER_WORKER = 4  # tasks per worker and wave, to even out uneven statements
+
+def statement_expression(statement):
+    if statement.__class__ in (VariableDeclaration, UnitConversionStatement, PrintStatement):
+        return statement.expression
+    return statement  # expression statement
+
+class DependencyGraph:
+    """Data dependencies between the statements of a Program.
+
+    `dependencies[i]` maps each variable statement i reads to the index of
+    the `let` that produced the value it sees, so a later rebinding of the
+    name never has to wait for earlier readers; names no earlier `let` binds
+    are listed in `free_variables[i]`. `levels[i]` is one more than
+    the deepest statement i depends on; statements of the same level are
+    independent of each other.
+    """
+
+    def __init__(self, program):
+        self.statements = program.statements
+        self.dependencies = []
+        self.free_variables = []
+        self.levels = []
+        producers = {}
+        for index, statement in enumerate(self.statements):
+            reads = variable_reads(statement_expression(statement), set())
+            dependencies = {name: producers[name] for name in reads if name in producers}
+            self.dependencies.append(dependencies)
+            self.free_variables.append([name for name in reads if name not in producers])
+            self.levels.append(1 + max(self.levels[i] for i in dependencies.values()) if dependencies else 0)
+            if statement.__class__ is VariableDeclaration:
+                producers[statement.name] = index
+
+    def waves(self):
+        """Group statement indexes by level, lowest level first."""
+        waves = []
+        for index, level in enumerate(self.levels):
+            if level == len(waves):
+                waves.append([])
+            waves[level].append(index)
+        return waves
+
+def run_chunk(statements, chunk):
+    """Evaluate the statements at the (index, environment) pairs of `chunk`.
+
+    Returns (index, value, outputs, error) for each statement, where value
+    is the bound value of a `let`.
+    """
+    outputs = []
+    interpreter = Interpreter(output=outputs.append)
+    results = []
+    for index, environment in chunk:
+        statement = statements[index]
+        interpreter.environment = environment
+        del outputs[:]
+        try:
+            interpreter.evaluate(statement)
+        except Exception as e:
+            results.append((index, None, [], e))
+            continue
+        value = environment.get(statement.name) if statement.__class__ is VariableDeclaration else None
+        results.append((index, value, list(outputs), None))
+    return results
+
+# Process workers get the statements once, when they start, so tasks only
+# carry indexes and the values each statement reads
+worker_statements = None
+
+def start_worker(statements):
+    global worker_statements
+    worker_statements = statements
+
+def run_worker_chunk(chunk):
+    return run_chunk(worker_statements, chunk)
+
+def run_parallel(program, workers=None, pool='thread', output=print, inputs=None):
+    """Run a Program with independent statements evaluated concurrently.
+
+    Statements are run in waves of equal dependency level (see
+    DependencyGraph), each wave split into chunks for a `pool` ('thread' or
+    'process') of `workers` workers. Output is sent to `output` in source
+    order, and the first error in source order is raised after the output of
+    the statements before it, exactly as the interpreter would. Returns the
+    final bindings. Threads only overlap work that releases the GIL; use
+    'process' for speed-ups on CPU-bound scripts.
+    """
+    graph = DependencyGraph(program)
+    statements = graph.statements
+    workers = workers or os.cpu_count() or 1
+    inputs = dict(inputs) if inputs else {}
+    environment = dict(inputs)
+    values = [None] * len(statements)
+    outputs = [None] * len(statements)  # set once a statement has run
+    flushed = 0
+    first_error = len(statements)
+    error = None
+    if pool == 'process':
+        executor = ProcessPoolExecutor(workers, initializer=start_worker, initargs=(statements,))
+        task = run_worker_chunk
+    elif pool == 'thread':
+        executor = ThreadPoolExecutor(workers)
+        task = partial(run_chunk, statements)
+    else:
+        raise ValueError(f"Unknown pool: {pool}")
+    with executor:
+        for wave in graph.waves():
+            # Statements after a known error never have to run
+            wave = [index for index in wave if index < first_error]
+            if not wave:
+                continue
+            tasks = []
+            for index in wave:
+                task_environment = {name: inputs[name] for name in graph.free_variables[index] if name in inputs}
+                for name, producer in graph.dependencies[index].items():
+                    task_environment[name] = values[producer]
+                tasks.append((index, task_environment))
+            size = -(-len(tasks) // (workers * CHUNKS_PER_WORKER))
+            chunks = [tasks[i:i + size] for i in range(0, len(tasks), size)]
+            for results in executor.map(task, chunks):
+                for index, value, statement_outputs, statement_error in results:
+                    if statement_error is not None:
+                        if index < first_error:
+                            first_error, error = index, statement_error
+                        continue
+                    values[index] = value
+                    outputs[index] = statement_outputs
+            # Send on the output of every statement whose predecessors have all run
+            while flushed < first_error and outputs[flushed] is not None:
+                for value in outputs[flushed]:
+                    output(value)
+                if statements[flushed].__class__ is VariableDeclaration:
+                    environment[statements[flushed].name] = values[flushed]
+                flushed += 1
+    if error is not None:
+        raise error
+    return final_bindings(environment)
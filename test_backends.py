@@ -0,0 +1,217 @@
+"""Differential tests: every evaluator and optimizer pass against the interpreter.
+
+Programs are generated from seeds, so a failure names a reproducible case.
+FUZZ_PROGRAMS sets how many programs each test runs (default 300); run with
+e.g. FUZZ_PROGRAMS=20000 for a longer search.
+"""
+import io
+import math
+import os
+import random
+from contextlib import redirect_stdout
+
+import pytest
+
+from lexer import iter_tokens
+from parser import Parser, VariableDeclaration
+from interpreter import Interpreter, Quantity
+from closure_compiler import compile_program
+from bytecode import Bytecode, VM, compile_bytecode
+from codegen import compile_python
+from columnar import Column, run_columns
+from resolver import ResolveError, resolve_variables
+from scheduler import run_parallel
+from optimizer import fold_constants, eliminate_dead_bindings, eliminate_common_subexpressions
+
+PROGRAMS = int(os.environ.get('FUZZ_PROGRAMS', 300))
+
+UNITS = ['m', 'km', 'miles', 'kg', 'pounds', 'hours', 's', 'min', 'celsius', 'fahrenheit', 'kelvin',
+         'USD', 'EUR', 'm/s', 'km/h', 'J', 'kJ', 'W', 'square_feet']
+FUNCTIONS = ['calculate_sum', 'calculate_max', 'calculate_min', 'calculate_speed', 'miles_to_km',
+             'km_to_miles', 'celsius_to_fahrenheit', 'hours_to_minutes', 'currency_convert', 'nope']
+NAMES = ['a', 'b', 'c', 'x', 'y']
+INPUTS = {'x': Quantity(3.0, 'km'), 'y': 2.0}
+
+# Units by dimension, and built-ins by arity, for programs that mostly run cleanly
+DIMENSIONS = {'length': ['m', 'km', 'miles'], 'mass': ['kg', 'pounds'], 'time': ['hours', 's', 'min']}
+UNARY_FUNCTIONS = ['miles_to_km', 'km_to_miles', 'kg_to_pounds', 'celsius_to_kelvin', 'hours_to_minutes']
+BINARY_FUNCTIONS = ['calculate_speed', 'calculate_max', 'calculate_min']
+
+def number(r, names, depth):
+    choice = r.random()
+    numbers = [name for name, kind in names if kind == 'number']
+    if depth > 3 or choice < 0.35:
+        if numbers and r.random() < 0.5:
+            return r.choice(numbers)
+        return str(r.choice([r.randint(1, 50), round(r.uniform(1, 50), 2)]))
+    if choice < 0.7:
+        return f"({number(r, names, depth + 1)} {r.choice('+-*/')} {number(r, names, depth + 1)})"
+    if choice < 0.85:
+        return f"{r.choice(UNARY_FUNCTIONS)}({number(r, names, depth + 1)})"
+    return f"{r.choice(BINARY_FUNCTIONS)}({number(r, names, depth + 1)}, {number(r, names, depth + 1)})"
+
+def quantity(r, names, dimension, depth):
+    choice = r.random()
+    quantities = [name for name, kind in names if kind == dimension]
+    if depth > 3 or choice < 0.4:
+        if quantities and r.random() < 0.5:
+            return r.choice(quantities)
+        return f"{r.randint(1, 100)}{r.choice(DIMENSIONS[dimension])}"
+    if choice < 0.75:
+        return f"{quantity(r, names, dimension, depth + 1)} {r.choice('+-')} {quantity(r, names, dimension, depth + 1)}"
+    if choice < 0.85:
+        return f"({quantity(r, names, dimension, depth + 1)} {r.choice('*/')} ({number(r, names, depth + 1)}))"
+    if choice < 0.92:
+        return f"(({number(r, names, depth + 1)}) * {quantity(r, names, dimension, depth + 1)})"
+    return f"({quantity(r, names, dimension, depth + 1)} / {quantity(r, names, dimension, depth + 1)} * 1{r.choice(DIMENSIONS[dimension])})"
+
+def typed_program_source(seed):
+    r = random.Random(seed)
+    names = [('x', 'length'), ('y', 'number')]
+    statements = []
+    for _ in range(12):
+        kind = r.random()
+        dimension = r.choice(list(DIMENSIONS))
+        if kind < 0.55:
+            name = f"v{r.randint(0, 8)}"
+            if r.random() < 0.5:
+                value, dimension = number(r, names, 0), 'number'
+            else:
+                value = quantity(r, names, dimension, 0)
+            names = [(other, kind) for other, kind in names if other != name] + [(name, dimension)]
+            statements.append(f"let {name} = {value};")
+        elif kind < 0.75:
+            statements.append(f"print {quantity(r, names, dimension, 0) if r.random() < 0.6 else number(r, names, 0)};")
+        elif kind < 0.9:
+            statements.append(f"convert ({quantity(r, names, dimension, 0)}) to {r.choice(DIMENSIONS[dimension])};")
+        else:
+            statements.append(f"{r.choice(UNARY_FUNCTIONS)}({number(r, names, 0)});")
+    return "\n".join(statements)
+
+def expression(r, names, depth=0):
+    choice = r.random()
+    if depth > 4 or choice < 0.4:
+        kind = r.random()
+        if kind < 0.35 and names:
+            return r.choice(names)
+        if kind < 0.4:
+            return r.choice(NAMES)  # Possibly undefined
+        if kind < 0.75:
+            return f"{r.choice([0, 1, 2, 3.5, 10, 42])}{r.choice(UNITS)}"
+        return str(r.choice([0, 1, 2, 2.5, 7, 0.1]))
+    if choice < 0.85:
+        return f"({expression(r, names, depth + 1)} {r.choice('+-*/')} {expression(r, names, depth + 1)})"
+    args = ', '.join(expression(r, names, depth + 1) for _ in range(r.randint(0, 3)))
+    return f"{r.choice(FUNCTIONS)}({args})"
+
+def random_program_source(seed):
+    r = random.Random(seed)
+    names = ['x', 'y']
+    statements = []
+    for _ in range(r.randint(1, 10)):
+        kind = r.random()
+        if kind < 0.5:
+            name = r.choice(NAMES)
+            statements.append(f"let {name} = {expression(r, names)};")
+            names.append(name)
+        elif kind < 0.75:
+            statements.append(f"print {expression(r, names)};")
+        elif kind < 0.95:
+            statements.append(f"convert({expression(r, names)}) to {r.choice(UNITS)};")
+        else:
+            statements.append(f"{expression(r, names)};")
+    return "\n".join(statements)
+
+def parse_source(source):
+    tokens = list(iter_tokens(source))
+    parser = Parser(tokens)
+    with redirect_stdout(io.StringIO()):
+        program = parser.parse()
+    return program
+
+def outcome(run, program):
+    """Everything observable about a run: output, printed text and bindings, or the error."""
+    output = []
+    with redirect_stdout(io.StringIO()) as printed:
+        try:
+            environment = run(program, output.append)
+        except ResolveError:
+            return None
+        except Exception as e:
+            return ('error', type(e).__name__, str(e), list(map(repr, output)), printed.getvalue())
+    bindings = sorted((name, repr(value)) for name, value in environment.items())
+    return ('ok', list(map(repr, output)), bindings, printed.getvalue())
+
+def interpret(program, output):
+    interpreter = Interpreter(output=output)
+    interpreter.environment.update(INPUTS)
+    return interpreter.evaluate(program)
+
+def declared_names(program):
+    return [statement.name for statement in program.statements if statement.__class__ is VariableDeclaration]
+
+BACKENDS = {
+    'closure': lambda program, output: compile_program(program)(INPUTS, output),
+    'resolved': lambda program, output: compile_program(resolve_variables(program, tuple(INPUTS)))(INPUTS, output),
+    'bytecode': lambda program, output: VM(compile_bytecode(program)).run(INPUTS, output),
+    'bytecode-file': lambda program, output: VM(Bytecode.from_bytes(compile_bytecode(program).to_bytes())).run(INPUTS, output),
+    'codegen': lambda program, output: compile_python(program)(INPUTS, output),
+    'scheduler': lambda program, output: run_parallel(program, 2, output=output, inputs=INPUTS),
+    'folded': lambda program, output: interpret(fold_constants(program)[0], output),
+    'dead-bindings': lambda program, output: interpret(
+        eliminate_dead_bindings(program, keep=declared_names(program) + list(INPUTS))[0], output),
+    'cse': lambda program, output: interpret(eliminate_common_subexpressions(program)[0], output),
+}
+
+GENERATORS = {'typed': typed_program_source, 'random': random_program_source}
+
+@pytest.mark.parametrize('generator', GENERATORS)
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backend_matches_the_interpreter(backend, generator):
+    run = BACKENDS[backend]
+    for seed in range(PROGRAMS):
+        source = GENERATORS[generator](seed)
+        program = parse_source(source)
+        expected = outcome(interpret, program)
+        got = outcome(run, program)
+        if got is not None:  # None: the resolver rejected the program up front
+            assert got == expected, f"seed {seed}:\n{source}"
+
+def row_values(values):
+    # Columns hold float64 rows, so plain numbers are compared as floats
+    return [(float(value.value), value.unit) if value.__class__ is Quantity else (float(value), None)
+            for value in values]
+
+def close(first, second):
+    return len(first) == len(second) and all(
+        unit == other_unit and (value == other_value or math.isclose(value, other_value, rel_tol=1e-9, abs_tol=1e-12)
+                                or math.isnan(value) and math.isnan(other_value))
+        for (value, unit), (other_value, other_unit) in zip(first, second))
+
+def test_columnar_matches_the_interpreter_row_by_row():
+    for seed in range(PROGRAMS):
+        source = typed_program_source(seed)
+        program = parse_source(source)
+        r = random.Random(seed)
+        rows = [{'x': Quantity(r.uniform(1, 90), 'km'), 'y': float(r.randint(1, 9))} for _ in range(5)]
+        expected, errors = [], set()
+        for row in rows:
+            output = []
+            interpreter = Interpreter(output=output.append)
+            interpreter.environment.update(row)
+            try:
+                interpreter.evaluate(program)
+            except Exception as e:
+                errors.add(type(e).__name__)
+            expected.append(row_values(output))
+        columns = {'x': Column([row['x'].value for row in rows], 'km'), 'y': [row['y'] for row in rows]}
+        output = []
+        try:
+            run_columns(program, columns, output=output.append)
+        except Exception as e:
+            # Statements run over every row in turn, so the error may come from any failing row
+            assert type(e).__name__ in errors, f"seed {seed}:\n{source}"
+            continue
+        assert not errors, f"seed {seed}:\n{source}"
+        got = [row_values(row) for row in zip(*(column.rows() for column in output))] or [[] for _ in rows]
+        assert all(close(a, b) for a, b in zip(expected, got)), f"seed {seed}:\n{source}"
@@ -0,0 +1,31 @@
+import io
+from contextlib import redirect_stdout
+
+from compile_cache import CompileCache, compile_source, compile_file
+
+SOURCE = "let a = 2km; print a;"
+
+def test_hit_returns_the_same_program(tmp_path):
+    cache = CompileCache(str(tmp_path / 'cache'))
+    output = str(tmp_path / 'tokens.txt')
+    first = compile_source(SOURCE, output, cache)
+    second = compile_source(SOURCE, output, cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert [(t.type, t.value) for t in first[0]] == [(t.type, t.value) for t in second[0]]
+    assert repr(first[1]) == repr(second[1])
+
+def test_unusable_directory_only_disables_the_cache(tmp_path):
+    blocker = tmp_path / 'blocker'
+    blocker.write_text('not a directory')
+    cache = CompileCache(str(blocker / 'cache'))
+    output = str(tmp_path / 'tokens.txt')
+    script = tmp_path / 'script.txt'
+    script.write_text(SOURCE)
+    with redirect_stdout(io.StringIO()):
+        for _ in range(2):
+            tokens, program = compile_source(SOURCE, output, cache)
+            assert len(program.statements) == 2
+        tokens, program = compile_file(str(script), output, cache)
+    assert len(program.statements) == 2
+    assert (cache.hits, cache.misses) == (0, 3)
+    assert cache.entries() == []
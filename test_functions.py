@@ -0,0 +1,19 @@
+from functions import FUNCTIONS, MemoizedFunction, memoize_functions
+
+def test_cache_sizes_override_pure_functions():
+    memoized = memoize_functions(FUNCTIONS, {'convert_length': 10, 'get_conversion_factor': 0})
+    assert isinstance(memoized['convert_length'], MemoizedFunction)
+    assert memoized['get_conversion_factor'] is FUNCTIONS['get_conversion_factor']
+
+def test_impure_functions_are_never_memoized():
+    calls = []
+    def record(value):
+        calls.append(value)
+        return value
+    memoized = memoize_functions({'record': record, 'normalize_unit': FUNCTIONS['normalize_unit']},
+                                 {'record': 10, 'normalize_unit': 10})
+    assert memoized['record'] is record
+    assert memoized['normalize_unit'] is FUNCTIONS['normalize_unit']
+    memoized['record'](1)
+    memoized['record'](1)
+    assert calls == [1, 1]
@@ -0,0 +1,97 @@
+import io
+import os
+import random
+
+import pytest
+
+from lexer import Lexer, RegexLexer, TokenStream, iter_tokens, iter_buffer_tokens, iter_file_tokens, value_key
+from parser import ASTArena, Program, PrintStatement, NumberLiteral, UnitValue
+from bytecode import compile_bytecode
+
+# Random sources per engine; FUZZ_SOURCES=100000 searches longer
+SOURCES = int(os.environ.get('FUZZ_SOURCES', 3000))
+
+# Fragments random sources are made of: ASCII lexemes for the regex fast paths,
+# and non-ASCII letters, compound units and bad characters for the fallbacks
+FRAGMENTS = list("abcXYZ_09.5 \n\t+-*/=;(),mkis") + [
+    'é', '°', 'C', '²', '½', '\u3000', '\r', '\x1c', '#', 'let ', 'print ', 'convert', ' to ', 'miles_to_km',
+    '10miles', 'm/s', '\n\n', '5°C', 'éé ', '^', '^-2', 'km/h', 'µs', 'xyz', 'kHz', '3m/s^2', '7lb',
+    'square_feet', '2kilometer_per_hour', 'usd',
+]
+
+def token_trace(tokens):
+    """Every token with its value type and position, ending with the error if lexing fails."""
+    trace = []
+    try:
+        for token in tokens:
+            trace.append((token.type, token.value, type(token.value), token.line, token.column))
+    except Exception as e:  # LexicalError, or the ValueError a digit such as '²' still causes
+        trace.append((type(e).__name__, str(e)))
+    return trace
+
+def engine_tokens(engine):
+    def tokens(source):
+        lexer = engine(source)
+        while True:
+            token = lexer.get_next_token()
+            yield token
+            if token.type == 'EOF':
+                return
+    return tokens
+
+def stream_trace(source):
+    # from_source raises before returning the stream, so only the error is compared
+    try:
+        return token_trace(TokenStream.from_source(source))
+    except Exception as e:
+        return [(type(e).__name__, str(e))]
+
+ENGINES = {
+    'regex': engine_tokens(RegexLexer),
+    'iter_tokens': iter_tokens,
+    'iter_tokens legacy': lambda source: iter_tokens(source, 'legacy'),
+    'iter_tokens file': lambda source: iter_tokens(io.StringIO(source)),
+    'mapped': lambda source: iter_buffer_tokens(source.encode('utf-8')),
+}
+
+def random_source(r):
+    return ''.join(r.choice(FRAGMENTS) for _ in range(r.randint(0, 25)))
+
+@pytest.mark.parametrize('engine', list(ENGINES) + ['token stream'])
+def test_lexer_engines_match_the_character_lexer(engine):
+    r = random.Random(engine)
+    for _ in range(SOURCES):
+        source = random_source(r)
+        expected = token_trace(engine_tokens(Lexer)(source))
+        if engine == 'token stream':
+            got = stream_trace(source)
+            if len(got) == 1 and len(expected[-1]) == 2:
+                got = expected[:-1] + got
+        elif engine == 'iter_tokens file' and '\r' in source:
+            continue  # Files are read in lines, and a lone '\r' ends one there
+        else:
+            got = token_trace(ENGINES[engine](source))
+        assert got == expected, repr(source)
+
+def test_mapped_files_match_the_character_lexer(tmp_path):
+    r = random.Random(0)
+    path = tmp_path / 'script.txt'
+    for _ in range(SOURCES // 10):
+        source = random_source(r)
+        path.write_bytes(source.encode('utf-8'))
+        assert token_trace(iter_file_tokens(str(path))) == token_trace(engine_tokens(Lexer)(source)), repr(source)
+
+def test_value_key_tells_equal_but_different_literals_apart():
+    values = [0, 0.0, -0.0, False, 1, 1.0, True, (0.0, 'm'), (-0.0, 'm'), (1, 'm'), (1.0, 'm')]
+    assert len({value_key(value) for value in values}) == len(values)
+    assert value_key(2.5) == value_key(2.5)
+
+def test_value_tables_keep_signed_zeros():
+    stream = TokenStream.from_source("print 0.0; print 0; print 1; print 1.0;")
+    assert [token.value for token in stream][1::3] == [0.0, 0, 1, 1.0]
+    assert [type(token.value) for token in stream][1::3] == [float, int, int, float]
+    program = Program([PrintStatement(NumberLiteral(0.0)), PrintStatement(NumberLiteral(-0.0)),
+                       PrintStatement(UnitValue(0.0, 'm')), PrintStatement(UnitValue(-0.0, 'm'))])
+    arena = ASTArena.from_tree(program)
+    assert [repr(statement) for statement in arena.to_tree().statements] == [repr(s) for s in program.statements]
+    assert [str(value) for value in compile_bytecode(program).constants] == ['0.0', '-0.0', "(0.0, 'm')", "(-0.0, 'm')"]
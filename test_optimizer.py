@@ -0,0 +1,38 @@
+import io
+from contextlib import redirect_stdout
+
+import pytest
+
+from lexer import iter_tokens
+from parser import parse
+from interpreter import EvaluationError, interpret
+from optimizer import eliminate_common_subexpressions
+
+def parse_source(source):
+    with redirect_stdout(io.StringIO()):
+        return parse(list(iter_tokens(source)))
+
+def run(program):
+    output = []
+    try:
+        return output, interpret(program, output.append)
+    except EvaluationError as e:
+        return output, str(e)
+
+def test_shared_expressions_keep_their_results():
+    program = parse_source("let a = 2km; let b = (a * 3) + (a * 3); print a * 3; convert(a * 3) to m;")
+    optimized, stats = eliminate_common_subexpressions(program)
+    assert stats['shared_subexpressions'] > 0
+    output, environment = run(optimized)
+    assert (output, environment) == run(program)
+    assert not any(name.startswith('$') for name in environment)
+
+@pytest.mark.parametrize('source', [
+    "print (2 hours + 10) + (b * 2); print b * 2;",
+    "let x = calculate_max(1m + 2kg, b * 2); print b * 2;",
+    "print 1 + 2; print (4 / 0) + calculate_max(b, 1) * 2; print calculate_max(b, 1) * 2;",
+])
+def test_hoisting_keeps_the_first_error(source):
+    program = parse_source(source)
+    optimized, _ = eliminate_common_subexpressions(program)
+    assert run(optimized) == run(program)
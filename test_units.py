@@ -0,0 +1,53 @@
+import io
+from contextlib import redirect_stdout
+
+import pytest
+
+import currency
+from lexer import iter_tokens, iter_buffer_tokens
+from parser import Parser, UnitConversionStatement
+from functions import normalize_unit
+from units import REGISTRY, convert_from_base
+
+SPELLINGS = sorted(REGISTRY.index)
+
+LEXERS = {
+    'legacy': lambda source: list(iter_tokens(source, 'legacy')),
+    'regex': lambda source: list(iter_tokens(source, 'regex')),
+    'mapped': lambda source: list(iter_buffer_tokens(source.encode('utf-8'))),
+}
+
+def parse_quietly(tokens):
+    parser = Parser(tokens)
+    with redirect_stdout(io.StringIO()):
+        program = parser.parse()
+    return program, parser.errors
+
+@pytest.mark.parametrize('engine', LEXERS)
+def test_every_spelling_is_a_unit_value(engine):
+    for spelling in SPELLINGS:
+        tokens = LEXERS[engine](f"let v = 2{spelling};")
+        assert tokens[3].type == 'UNIT_VALUE', spelling
+        assert tokens[3].value == (2.0, spelling)
+
+@pytest.mark.parametrize('engine', LEXERS)
+def test_every_spelling_is_a_convert_target(engine):
+    for spelling in SPELLINGS:
+        program, errors = parse_quietly(LEXERS[engine](f"convert (v) to {spelling};"))
+        assert errors == [], spelling
+        statement, = program.statements
+        assert statement.__class__ is UnitConversionStatement
+        assert statement.target_unit == spelling
+
+CURRENCIES = ('USD', 'EUR', 'GBP', 'JPY', 'INR')
+
+@pytest.mark.parametrize('rates', [None, {'usd': 1.0, 'eur': 0.5, 'gbp': 0.25, 'jpy': 150.0, 'inr': 80.0}])
+def test_currency_base_conversions_use_the_current_rates(rates):
+    saved = currency.RATES
+    currency.use_provider(currency.StaticRateProvider(rates))
+    try:
+        for code in CURRENCIES:
+            assert normalize_unit(3, code) == pytest.approx(currency.convert(3, code, 'USD'))
+            assert convert_from_base(3, code) == pytest.approx(currency.convert(3, 'USD', code))
+    finally:
+        currency.RATES = saved
@@ -1,7 +1,7 @@
 import tkinter as tk
 from tkinter import scrolledtext, ttk
-from parser import parse,print_ast
-from lexer import scan
+from parser import print_ast
+from compile_cache import compile_source
 
 # Function to run code
 def run_code():
@@ -10,23 +10,22 @@ def run_code():
     output_area.delete("1.0", tk.END)
 
     output_token_file = 'token-output-ui.txt'
-    tokens = scan(code, output_token_file)
-
-    if isinstance(tokens, str): # Lexical error occurred during scanning
-        output_area.insert(tk.END, f"Lexical Error:\n{tokens}\n")
-    else: # Assume successful lexing (tokens is a list)
-        try:
-            ast = parse(tokens[:-1])
+    try:
+        # Unchanged code is not lexed or parsed again: both come from the on-disk cache
+        tokens, ast = compile_source(code, output_token_file)
+        if isinstance(tokens, str): # Lexical error occurred during scanning
+            output_area.insert(tk.END, f"Lexical Error:\n{tokens}\n")
+        else: # Successful lexing (tokens is a list)
             print_ast(ast)
             output_area.insert(tk.END, "\nParsing Successfull..syntax is correct!\n")
             # Optional: output_area.insert(tk.END, "\nAbstract Syntax Tree:\n")
             # Optional: output_area.insert(tk.END, str(ast))
-        except SyntaxError as e:
-            # print("SyntaxError caught in UI:", e) # Keep for debugging
-            output_area.insert(tk.END, f"\nParsing Error: {e}\n")
-        except Exception as e:
-            print("Unexpected error during parsing:", e) # Catch any other parsing issues
-            output_area.insert(tk.END, f"\nAn unexpected error occurred during parsing: {e}\n")
+    except SyntaxError as e:
+        # print("SyntaxError caught in UI:", e) # Keep for debugging
+        output_area.insert(tk.END, f"\nParsing Error: {e}\n")
+    except Exception as e:
+        print("Unexpected error during parsing:", e) # Catch any other parsing issues
+        output_area.insert(tk.END, f"\nAn unexpected error occurred during parsing: {e}\n")
 
     output_area.config(state=tk.DISABLED)
 
@@ -0,0 +1,158 @@
+from parser import (Program, VariableDeclaration, UnitConversionStatement, PrintStatement,
+                    BinaryOperation, UnitValue, NumberLiteral, Variable, FunctionCall)
+from functions import FUNCTIONS
+from resolver import ResolvedProgram, LocalDeclaration, LocalVariable
+import currency
+import units
+
+class UnitCheckError(Exception):
+    """Raised by check_units with every unit error found in a program."""
+
+    def __init__(self, errors):
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+# Static types are (unit, dimension vector) pairs. Plain numbers have no unit;
+# a unit the registry does not know has no vector and only matches itself.
+NUMBER = (None, units.DIMENSIONLESS)
+
+def combine(first, second, sign):
+    if first is None or second is None:
+        return None
+    return tuple(a + sign * b for a, b in zip(first, second))
+
+def convertible(from_unit, to_unit):
+    # Mirrors interpreter.convert_quantity: identical spellings always convert,
+    # and currencies convert at whatever rate is current when the program runs
+    return (from_unit == to_unit or units.is_compatible(from_unit, to_unit)
+            or currency.is_currency_pair(from_unit, to_unit))
+
+def describe(static_type):
+    return 'a plain number' if static_type[0] is None else static_type[0]
+
+class UnitChecker:
+    """Static unit pass over a Program.
+
+    Every expression gets the unit it will carry at run time and that unit's
+    dimension vector, recorded in `types` as a (unit, vector) pair. Sums, differences and
+    `convert` statements whose units are not compatible are reported in
+    `errors`, as are undefined variables and unknown functions, so a program
+    that checks cleanly never fails a unit check when it runs. Compatibility
+    is units.is_compatible, as at run time, so compound units such as
+    'miles/hours' convert to any unit with the same vector.
+    """
+
+    def __init__(self, functions=FUNCTIONS):
+        self.functions = functions
+        self.environment = {}
+        self.types = {}
+        self.errors = []
+        self.dispatch = {
+            Program: self.check_program,
+            ResolvedProgram: self.check_program,
+            VariableDeclaration: self.check_variable_declaration,
+            LocalDeclaration: self.check_variable_declaration,
+            UnitConversionStatement: self.check_unit_conversion,
+            PrintStatement: self.check_print,
+            BinaryOperation: self.check_binary_operation,
+            UnitValue: self.check_unit_value,
+            NumberLiteral: self.check_number,
+            Variable: self.check_variable,
+            LocalVariable: self.check_variable,
+            FunctionCall: self.check_function_call,
+        }
+
+    def check(self, node):
+        """Return the static type of `node`, or None once an error makes it unknown."""
+        static_type = self.dispatch[node.__class__](node)
+        if static_type is not None:
+            self.types[node] = static_type
+        return static_type
+
+    def error(self, message):
+        self.errors.append(message)
+        return None
+
+    def check_program(self, node):
+        for statement in node.statements:
+            self.check(statement)
+        return None
+
+    def check_variable_declaration(self, node):
+        # A failed expression binds the name as unknown so later uses stay quiet
+        self.environment[node.name] = self.check(node.expression)
+        return None
+
+    def check_unit_conversion(self, node):
+        static_type = self.check(node.expression)
+        if static_type is None:
+            return None
+        if static_type[0] is None:
+            return self.error(f"Cannot convert a plain number to {node.target_unit}")
+        if not convertible(static_type[0], node.target_unit):
+            return self.error(f"Cannot convert {static_type[0]} to {node.target_unit}")
+        return (node.target_unit, units.dimension_of(node.target_unit))
+
+    def check_print(self, node):
+        self.check(node.expression)
+        return None
+
+    def check_binary_operation(self, node):
+        left = self.check(node.left)
+        right = self.check(node.right)
+        if left is None or right is None:
+            return None
+        left_unit, left_dimension = left
+        right_unit, right_dimension = right
+        if node.op in ('+', '-'):
+            if left_unit is None and right_unit is None:
+                return NUMBER
+            verb = 'add' if node.op == '+' else 'subtract'
+            if left_unit is None or right_unit is None or not convertible(right_unit, left_unit):
+                return self.error(f"Cannot {verb} {describe(left)} and {describe(right)}")
+            return left
+        if node.op == '*':
+            if left_unit is None:
+                return right
+            if right_unit is None:
+                return left
+            return (units.multiply_units(left_unit, right_unit), combine(left_dimension, right_dimension, 1))
+        if left_unit is None:
+            if right_unit is None:
+                return NUMBER
+            return (units.divide_units('1', right_unit), combine(units.DIMENSIONLESS, right_dimension, -1))
+        if right_unit is None:
+            return left
+        if units.is_compatible(left_unit, right_unit):
+            return NUMBER
+        return (units.divide_units(left_unit, right_unit), combine(left_dimension, right_dimension, -1))
+
+    def check_unit_value(self, node):
+        return (node.unit, units.dimension_of(node.unit))
+
+    def check_number(self, node):
+        return NUMBER
+
+    def check_variable(self, node):
+        if node.name not in self.environment:
+            return self.error(f"Undefined variable: {node.name}")
+        return self.environment[node.name]
+
+    def check_function_call(self, node):
+        for arg in node.args:
+            self.check(arg)
+        if node.name not in self.functions:
+            return self.error(f"Unknown function: {node.name}")
+        # Built-ins are called with magnitudes and return plain numbers
+        return NUMBER
+
+def check_units(program, functions=FUNCTIONS):
+    """Check a Program before it runs; return the node -> (unit, dimension vector) map.
+
+    Raises UnitCheckError listing every problem found.
+    """
+    checker = UnitChecker(functions)
+    checker.check(program)
+    if checker.errors:
+        raise UnitCheckError(checker.errors)
+    return checker.types
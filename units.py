@@ -1,4 +1,14 @@
+import math
+from array import array
 from enum import Enum
+from fractions import Fraction
+from functools import lru_cache
+from types import MappingProxyType
+
+try:
+    import numpy
+except ImportError:  # batch conversions fall back to array('d')
+    numpy = None
 
 class UnitType(Enum):
     LENGTH = "length"
@@ -7,6 +17,13 @@ class UnitType(Enum):
     TEMPERATURE = "temperature"
     SPEED = "speed"
     CURRENCY = "currency"
+    FREQUENCY = "frequency"
+    VOLUME = "volume"
+    AREA = "area"
+    ANGLE = "angle"
+    PRESSURE = "pressure"
+    ENERGY = "energy"
+    POWER = "power"
 
 # Base units (SI units)
 BASE_UNITS = {
@@ -15,7 +32,14 @@ BASE_UNITS = {
     UnitType.TIME: 'second',
     UnitType.TEMPERATURE: 'kelvin',
     UnitType.SPEED: 'meter_per_second',
-    UnitType.CURRENCY: 'usd'  # Using USD as base currency
+    UnitType.CURRENCY: 'usd',  # Using USD as base currency
+    UnitType.FREQUENCY: 'hertz',
+    UnitType.VOLUME: 'cubic_meter',
+    UnitType.AREA: 'square_meter',
+    UnitType.ANGLE: 'radian',
+    UnitType.PRESSURE: 'pascal',
+    UnitType.ENERGY: 'joule',
+    UnitType.POWER: 'watt'
 }
 
 # Conversion factors to base units
@@ -44,18 +68,45 @@ CONVERSION_FACTORS = {
     'hour': 3600.0,
     'day': 86400.0,
     'week': 604800.0,
+    'year': 31557600.0,  # Julian year (365.25 days)
     
-    # Temperature (special handling)
-    'kelvin': lambda x: x,
-    'celsius': lambda x: x + 273.15,
-    'fahrenheit': lambda x: (x + 459.67) * 5/9,
-    
+    # Temperatures have an offset too; see TEMPERATURE_TRANSFORMS
+
     # Speed
     'meter_per_second': 1.0,
-    'kilometer_per_hour': 0.277778,
+    'kilometer_per_hour': 1000 / 3600,
     'mile_per_hour': 0.44704,
+
+    # Frequency
+    'hertz': 1.0,
+
+    # Volume
+    'cubic_meter': 1.0,
+    'liter': 0.001,
+    'gallon': 0.003785411784,
+
+    # Area
+    'square_meter': 1.0,
+    'square_foot': 0.09290304,
+
+    # Angle
+    'radian': 1.0,
+    'degree': math.pi / 180,
+
+    # Pressure
+    'pascal': 1.0,
+    'psi': 6894.757293168361,
+
+    # Energy
+    'joule': 1.0,
+    'calorie': 4.184,
+
+    # Power
+    'watt': 1.0,
+    'horsepower': 745.6998715822702,
     
-    # Currency (example rates - should be updated dynamically)
+    # Currency: units per USD. Only the fallback rates; scripts get theirs from
+    # currency.RATES (see currency.use_provider)
     'usd': 1.0,
     'eur': 0.85,
     'gbp': 0.75,
@@ -63,111 +114,412 @@ CONVERSION_FACTORS = {
     'inr': 75.0
 }
 
-TEMP_REVERSE = {
-    'kelvin': {
-        'celsius': lambda k: k - 273.15,
-        'fahrenheit': lambda k: k * 9/5 - 459.67
-    }
+# Unit spellings used in scripts (and by the lexer), mapped to canonical names.
+# SI-prefixed forms (km, µs, kHz...) are generated from PREFIXABLE_UNITS instead.
+UNIT_ALIASES = {
+    'm': 'meter', 'meters': 'meter', 'kilometers': 'kilometer', 'centimeters': 'centimeter',
+    'millimeters': 'millimeter', 'mi': 'mile', 'miles': 'mile', 'yd': 'yard', 'yards': 'yard',
+    'ft': 'foot', 'feet': 'foot', 'in': 'inch', 'inches': 'inch',
+    'g': 'gram', 'grams': 'gram', 'kilograms': 'kilogram', 'milligrams': 'milligram',
+    'lb': 'pound', 'lbs': 'pound', 'pounds': 'pound', 'oz': 'ounce', 'ounces': 'ounce',
+    't': 'ton', 'tons': 'ton',
+    's': 'second', 'sec': 'second', 'seconds': 'second', 'min': 'minute', 'minutes': 'minute',
+    'h': 'hour', 'hr': 'hour', 'hours': 'hour', 'd': 'day', 'days': 'day',
+    'wk': 'week', 'weeks': 'week', 'yr': 'year', 'years': 'year',
+    'K': 'kelvin', 'Kelvin': 'kelvin', '°C': 'celsius', 'Celsius': 'celsius',
+    '°F': 'fahrenheit', 'Fahrenheit': 'fahrenheit',
+    'm/s': 'meter_per_second', 'km/h': 'kilometer_per_hour', 'kph': 'kilometer_per_hour',
+    'mph': 'mile_per_hour',
+    'Hz': 'hertz', 'L': 'liter', 'l': 'liter', 'liters': 'liter', 'gal': 'gallon', 'gallons': 'gallon',
+    'm^3': 'cubic_meter',
+    'm^2': 'square_meter', 'square_meters': 'square_meter', 'ft^2': 'square_foot', 'square_feet': 'square_foot',
+    'rad': 'radian', 'radians': 'radian', '°': 'degree', 'deg': 'degree', 'degrees': 'degree',
+    'Pa': 'pascal', 'pascals': 'pascal', 'J': 'joule', 'joules': 'joule', 'cal': 'calorie', 'calories': 'calorie',
+    'W': 'watt', 'watts': 'watt', 'hp': 'horsepower',
+    'USD': 'usd', 'EUR': 'eur', 'GBP': 'gbp', 'JPY': 'jpy', 'INR': 'inr',
+}
+
+# SI prefixes: symbol -> (name, power of ten)
+SI_PREFIXES = {
+    'Y': ('yotta', 24), 'Z': ('zetta', 21), 'E': ('exa', 18), 'P': ('peta', 15),
+    'T': ('tera', 12), 'G': ('giga', 9), 'M': ('mega', 6), 'k': ('kilo', 3),
+    'h': ('hecto', 2), 'da': ('deca', 1), 'd': ('deci', -1), 'c': ('centi', -2),
+    'm': ('milli', -3), 'µ': ('micro', -6), 'μ': ('micro', -6), 'u': ('micro', -6),
+    'n': ('nano', -9), 'p': ('pico', -12), 'f': ('femto', -15), 'a': ('atto', -18),
+    'z': ('zepto', -21), 'y': ('yocto', -24),
+}
+
+# Unit symbols that take SI prefixes, with their canonical names
+PREFIXABLE_UNITS = {'m': 'meter', 'g': 'gram', 's': 'second', 'Hz': 'hertz', 'L': 'liter',
+                    'Pa': 'pascal', 'J': 'joule', 'W': 'watt'}
+
+# Dimension vectors: exponents of (length, mass, time, temperature, currency)
+DIMENSIONLESS = (0, 0, 0, 0, 0)
+DIMENSIONS = {
+    UnitType.LENGTH: (1, 0, 0, 0, 0),
+    UnitType.MASS: (0, 1, 0, 0, 0),
+    UnitType.TIME: (0, 0, 1, 0, 0),
+    UnitType.TEMPERATURE: (0, 0, 0, 1, 0),
+    UnitType.SPEED: (1, 0, -1, 0, 0),
+    UnitType.CURRENCY: (0, 0, 0, 0, 1),
+    UnitType.FREQUENCY: (0, 0, -1, 0, 0),
+    UnitType.VOLUME: (3, 0, 0, 0, 0),
+    UnitType.AREA: (2, 0, 0, 0, 0),
+    UnitType.ANGLE: (0, 0, 0, 0, 0),
+    UnitType.PRESSURE: (-1, 1, -2, 0, 0),
+    UnitType.ENERGY: (2, 1, -2, 0, 0),
+    UnitType.POWER: (2, 1, -3, 0, 0),
+}
+
+# Canonical units by category (CONVERSION_FACTORS names, or TEMPERATURE_TRANSFORMS
+# names for temperatures)
+UNIT_CATEGORIES = {
+    UnitType.LENGTH: ('meter', 'kilometer', 'centimeter', 'millimeter', 'mile', 'yard', 'foot', 'inch'),
+    UnitType.MASS: ('kilogram', 'gram', 'milligram', 'pound', 'ounce', 'ton'),
+    UnitType.TIME: ('second', 'minute', 'hour', 'day', 'week', 'year'),
+    UnitType.TEMPERATURE: ('kelvin', 'celsius', 'fahrenheit'),
+    UnitType.SPEED: ('meter_per_second', 'kilometer_per_hour', 'mile_per_hour'),
+    UnitType.CURRENCY: ('usd', 'eur', 'gbp', 'jpy', 'inr'),
+    UnitType.FREQUENCY: ('hertz',),
+    UnitType.VOLUME: ('cubic_meter', 'liter', 'gallon'),
+    UnitType.AREA: ('square_meter', 'square_foot'),
+    UnitType.ANGLE: ('radian', 'degree'),
+    UnitType.PRESSURE: ('pascal', 'psi'),
+    UnitType.ENERGY: ('joule', 'calorie'),
+    UnitType.POWER: ('watt', 'horsepower'),
 }
 
+# Temperatures as affine maps to kelvin: base = value * scale + offset. Transforms
+# are kept as exact fractions so each pair is rounded to float only once.
+TEMPERATURE_TRANSFORMS = {
+    'kelvin': (Fraction(1), Fraction(0)),
+    'celsius': (Fraction(1), Fraction('273.15')),
+    'fahrenheit': (Fraction(5, 9), Fraction('459.67') * Fraction(5, 9)),
+}
+
+# Factors defined as ratios, kept exact instead of going through their float
+# values. Other factors are taken as the decimals written above.
+EXACT_SCALES = {
+    'kilometer_per_hour': Fraction(1000, 3600),
+}
+
+COMPOSED_CACHE_SIZE = 256
+
+class Unit:
+    """An interned unit: its canonical name, dimension vector and exact affine
+    map to the base unit (base = value * scale + offset).
+
+    Currencies have no scale: their CONVERSION_FACTORS entries are exchange
+    rates, so they only convert through a rate (see functions.currency_convert).
+    """
+    __slots__ = ('name', 'dimension', 'scale', 'offset')
+
+    def __init__(self, name, dimension, scale, offset=Fraction(0)):
+        self.name = name
+        self.dimension = dimension
+        self.scale = scale
+        self.offset = offset
+
+    def __repr__(self):
+        return f"Unit({self.name!r})"
+
+def unit_factors(unit):
+    """Split a composed unit such as 'miles/hours' or 'm/s^2' into (name, exponent) pairs, read left to right"""
+    factors = []
+    sign = 1
+    name = ''
+    for char in unit + '*':
+        if char in '*/':
+            base, caret, power = name.partition('^')
+            if not base or (caret and not power.lstrip('-').isdigit()):
+                raise ValueError(f"Malformed unit: {unit}")
+            if base != '1':
+                factors.append((base, sign * (int(power) if caret else 1)))
+            sign = 1 if char == '*' else -1
+            name = ''
+        else:
+            name += char
+    return factors
+
+class UnitRegistry:
+    """Every unit spelling the language knows, resolved to interned Units.
+
+    `index` is a precomputed hash index from each canonical name, alias and
+    SI-prefixed form to its Unit, so resolving a spelling is one dict lookup.
+    Compound spellings (km/h is an alias, but also m/s^2 or miles/hours) are
+    composed from their factors on first use and kept in a bounded LRU.
+    Built once, as REGISTRY, when the module is imported.
+    """
+
+    def __init__(self):
+        units = {}
+        for category, names in UNIT_CATEGORIES.items():
+            for name in names:
+                if category is UnitType.TEMPERATURE:
+                    scale, offset = TEMPERATURE_TRANSFORMS[name]
+                elif category is UnitType.CURRENCY:
+                    scale, offset = None, Fraction(0)
+                else:
+                    scale, offset = EXACT_SCALES.get(name) or Fraction(repr(CONVERSION_FACTORS[name])), Fraction(0)
+                units[name] = Unit(name, DIMENSIONS[category], scale, offset)
+
+        index = dict(units)
+        for symbol, name in PREFIXABLE_UNITS.items():
+            unit = units[name]
+            for prefix, (prefix_name, power) in SI_PREFIXES.items():
+                full_name = prefix_name + name
+                if full_name not in units:
+                    units[full_name] = Unit(full_name, unit.dimension, unit.scale * Fraction(10) ** power)
+                index.setdefault(full_name, units[full_name])
+                index.setdefault(prefix + symbol, units[full_name])
+        # Explicit aliases win over generated prefixed forms (e.g. 'min', 'h')
+        index.update({alias: units[name] for alias, name in UNIT_ALIASES.items()})
+
+        self.units = MappingProxyType(units)
+        self.index = MappingProxyType(index)
+        self.compose = lru_cache(maxsize=COMPOSED_CACHE_SIZE)(self.compose_unit)
+
+    def __contains__(self, spelling):
+        return self.lookup(spelling) is not None
+
+    def lookup(self, spelling):
+        """Return the Unit for a spelling, or None if it is not a unit."""
+        unit = self.index.get(spelling)
+        if unit is None and ('/' in spelling or '*' in spelling or '^' in spelling):
+            unit = self.compose(spelling)
+        return unit
+
+    def compose_unit(self, spelling):
+        try:
+            factors = unit_factors(spelling)
+        except ValueError:
+            return None
+        names = []
+        scale = Fraction(1)
+        dimension = DIMENSIONLESS
+        for position, (name, exponent) in enumerate(factors):
+            unit = self.index.get(name)
+            # Affine units (temperatures) and currencies cannot be multiplied out
+            if unit is None or unit.scale is None or unit.offset:
+                return None
+            scale *= unit.scale ** exponent
+            dimension = tuple(a + exponent * b for a, b in zip(dimension, unit.dimension))
+            power = f"^{abs(exponent)}" if abs(exponent) != 1 else ''
+            if exponent < 0:
+                names.append(f"{'1' if position == 0 else ''}/{unit.name}{power}")
+            else:
+                names.append(f"{'*' if position else ''}{unit.name}{power}")
+        if not names:
+            return None
+        return Unit(''.join(names), dimension, scale)
+
+REGISTRY = UnitRegistry()
+
+def lookup_unit(unit):
+    """Return the interned Unit for a unit as written in a script, or None"""
+    return REGISTRY.lookup(unit)
+
+def canonical_unit(unit):
+    """Return the canonical name of a unit as written in a script"""
+    found = REGISTRY.lookup(unit)
+    return unit if found is None else found.name
+
+def dimension_of(unit):
+    """Return the dimension vector of a unit as written in a script, or None if it is not registered"""
+    found = REGISTRY.lookup(unit)
+    return None if found is None else found.dimension
+
 def is_compatible(unit1, unit2):
-    # Implement more sophisticated compatibility checks based on dimensions (length, mass, time, temp)
-    # For now, a simple check if they belong to the same general category might suffice initially
-    length_units = {'m', 'km', 'miles', 'feet', 'inches', 'cm', 'yards'}
-    mass_units = {'kg', 'pounds', 'ounces', 'grams'}
-    time_units = {'s', 'min', 'hour', 'day', 'year'}
-    temp_units = {'°C', 'Fahrenheit', 'Kelvin'}
-    speed_units = {'m/s'}
-
-    if unit1 in length_units and unit2 in length_units:
-        return True
-    if unit1 in mass_units and unit2 in mass_units:
-        return True
-    if unit1 in time_units and unit2 in time_units:
-        return True
-    if unit1 in temp_units and unit2 in temp_units:
-        return True
-    if unit1 in speed_units and unit2 in speed_units:
-        return True
-    return False
+    first = REGISTRY.lookup(unit1)
+    second = REGISTRY.lookup(unit2)
+    return (first is not None and second is not None and first.scale is not None
+            and second.scale is not None and first.dimension == second.dimension)
 
+def multiply_units(left, right):
+    """Name the product of two units, e.g. 'kg*m'"""
+    return f"{left}*{right}"
+
+def divide_units(left, right):
+    """Name the quotient of two units so that it still reads left to right: m / s*s is 'm/s/s'"""
+    inverted = right.translate(str.maketrans('*/', '/*'))
+    return f"{left}/{inverted}"
+
+def base_transform(unit):
+    """Return the exact (scale, offset) taking a registered unit to its base unit"""
+    found = REGISTRY.lookup(unit)
+    if found is None or found.scale is None:
+        raise KeyError(unit)
+    return (found.scale, found.offset)
+
+def pair_transform(from_transform, to_transform):
+    from_scale, from_offset = from_transform
+    to_scale, to_offset = to_transform
+    return (float(from_scale / to_scale), float((from_offset - to_offset) / to_scale))
+
+def make_converter(scale, offset):
+    """Build the callable applying value * scale + offset"""
+    if offset == 0.0:
+        return lambda value: value * scale
+    return lambda value: value * scale + offset
+
+def build_conversion_matrix():
+    transforms = {name: base_transform(name)
+                  for names in UNIT_CATEGORIES.values() for name in names
+                  if REGISTRY.units[name].scale is not None}
+    return {(from_unit, to_unit): pair_transform(transforms[from_unit], transforms[to_unit])
+            for from_unit in transforms for to_unit in transforms
+            if is_compatible(from_unit, to_unit)}
+
+# (from, to) -> (scale, offset) for every ordered pair of compatible named units,
+# and the matching converters, built once at import
+CONVERSION_MATRIX = MappingProxyType(build_conversion_matrix())
+CONVERTERS = MappingProxyType({pair: make_converter(*transform)
+                               for pair, transform in CONVERSION_MATRIX.items()})
+
+@lru_cache(maxsize=COMPOSED_CACHE_SIZE)
+def compose_transform(from_unit, to_unit):
+    """Return (and keep, least recently used first out) the (scale, offset) between any two unit spellings"""
+    if not is_compatible(from_unit, to_unit):
+        for unit in (from_unit, to_unit):
+            if REGISTRY.lookup(unit) is None:
+                raise ValueError(f"Unknown unit: {unit}")
+        raise ValueError(f"Cannot convert between {from_unit} and {to_unit}")
+    return pair_transform(base_transform(from_unit), base_transform(to_unit))
+
+@lru_cache(maxsize=COMPOSED_CACHE_SIZE)
+def compose_converter(from_unit, to_unit):
+    """Build (and keep) the converter between any two unit spellings"""
+    return make_converter(*compose_transform(from_unit, to_unit))
+
+def get_transform(from_unit, to_unit):
+    """Return the (scale, offset) converting from_unit to to_unit"""
+    transform = CONVERSION_MATRIX.get((from_unit, to_unit))
+    if transform is None:
+        transform = compose_transform(from_unit, to_unit)
+    return transform
+
+def get_converter(from_unit, to_unit):
+    """Return a reusable callable converting values from from_unit to to_unit.
+
+    Pairs of named units come straight from CONVERTERS; other spellings and
+    composed units (e.g. 'miles/hours' to 'm/s') go through compose_converter.
+    Raises ValueError if the units cannot be converted.
+    """
+    converter = CONVERTERS.get((from_unit, to_unit))
+    if converter is None:
+        converter = compose_converter(from_unit, to_unit)
+    return converter
+
+def unchanged(value):
+    return value
+
+@lru_cache(maxsize=COMPOSED_CACHE_SIZE)
+def compatible_converter(from_unit, to_unit):
+    """Return the converter between two unit spellings, or None if they are not compatible.
+
+    Kept per pair of spellings, so checking and converting a value at run
+    time is a single cache lookup. Spellings of the same unit get `unchanged`.
+    """
+    if not is_compatible(from_unit, to_unit):
+        return None
+    from_name = canonical_unit(from_unit)
+    to_name = canonical_unit(to_unit)
+    if from_name == to_name:
+        return unchanged
+    return get_converter(from_name, to_name)
+
+def apply_batch(values, scale, offset=0.0):
+    """Return values * scale + offset for a whole sequence at once.
+
+    With NumPy this is one vectorised multiply (and add) over a float64
+    array; without it the result is an array('d') filled through C-level
+    float methods rather than a Python loop. Any iterable of numbers or
+    buffer-protocol sequence (array, memoryview) is accepted.
+    """
+    if numpy is not None:
+        result = numpy.asarray(values, dtype=numpy.float64) * scale
+        if offset:
+            result += offset
+        return result
+    result = map(float(scale).__mul__, values)
+    if offset:
+        result = map(float(offset).__add__, result)
+    return array('d', result)
+
+def convert_batch(values, from_unit, to_unit):
+    """Convert a sequence of values between units in one pass (see apply_batch)"""
+    return apply_batch(values, *get_transform(from_unit, to_unit))
 
 def get_conversion_factor(from_unit, to_unit):
-    """Get the conversion factor between two compatible units"""
+    """Get the conversion factor between two compatible units, in any spelling.
+
+    Temperatures have an offset as well, so for them the (from, to) pair is
+    returned instead; convert through normalize_to_base / convert_from_base.
+    """
     if not is_compatible(from_unit, to_unit):
         raise ValueError(f"Cannot convert between {from_unit} and {to_unit}")
-    
-    # Handle temperature separately
-    if from_unit in ['kelvin', 'celsius', 'fahrenheit']:
-        # We need to know we're dealing with temperature
-        # This requires special handling in the interpreter
+
+    from_name = canonical_unit(from_unit)
+    to_name = canonical_unit(to_unit)
+    # Temperatures need special handling in the caller
+    if from_name in TEMPERATURE_TRANSFORMS or to_name in TEMPERATURE_TRANSFORMS:
         return (from_unit, to_unit)
-    
-    # For other units, calculate the factor
-    if from_unit == to_unit:
+
+    if from_name == to_name:
         return 1.0
-    
-    # Convert from_unit to base unit
-    from_factor = CONVERSION_FACTORS[from_unit]
-    to_factor = CONVERSION_FACTORS[to_unit]
-    
-    # If either is a function (like temperature), we need special handling
-    if callable(from_factor) or callable(to_factor):
-        return (from_unit, to_unit)
-    
-    return from_factor / to_factor
+
+    return get_transform(from_name, to_name)[0]
+
+@lru_cache(maxsize=COMPOSED_CACHE_SIZE)
+def base_conversion(unit, from_base=False):
+    """Return the (scale, offset) from a unit spelling to its base unit, or back.
+
+    None for currencies, which have no fixed scale (see currency_to_base).
+    """
+    found = REGISTRY.lookup(unit)
+    if found is not None and found.scale is None:
+        return None
+    transform = base_transform(unit) # KeyError for an unknown unit
+    identity = (Fraction(1), Fraction(0))
+    return pair_transform(identity, transform) if from_base else pair_transform(transform, identity)
+
+def currency_to_base(value, unit, from_base=False):
+    # At the current exchange rate, never the fallback CONVERSION_FACTORS entries
+    import currency  # currency imports this module, so not at the top
+    base = BASE_UNITS[UnitType.CURRENCY]
+    return currency.convert(value, base, unit) if from_base else currency.convert(value, unit, base)
 
 def normalize_to_base(value, unit):
     """Convert a value to its base unit"""
-    if unit in ['celsius', 'fahrenheit']:
-        # Convert to kelvin
-        return CONVERSION_FACTORS[unit](value)
-    elif callable(CONVERSION_FACTORS[unit]):
-        # Handle other special cases if any
-        return CONVERSION_FACTORS[unit](value)
-    else:
-        return value * CONVERSION_FACTORS[unit]
+    transform = base_conversion(unit)
+    if transform is None:
+        return currency_to_base(value, unit)
+    scale, offset = transform
+    return value * scale + offset if offset else value * scale
 
 def convert_from_base(value, unit):
     """Convert a value from base unit to target unit"""
-    if unit in ['celsius', 'fahrenheit']:
-        return TEMP_REVERSE['kelvin'][unit](value)
-    elif callable(CONVERSION_FACTORS[unit]):
-        # Handle other special cases if any
-        return CONVERSION_FACTORS[unit](value)
-    else:
-        return value / CONVERSION_FACTORS[unit]
+    transform = base_conversion(unit, True)
+    if transform is None:
+        return currency_to_base(value, unit, True)
+    scale, offset = transform
+    return value * scale + offset if offset else value * scale
 
 
 def convert_value(value, from_unit, to_unit):
     if is_compatible(from_unit, to_unit):
-        if from_unit == to_unit:
-            return value
-
-        try:
-            # Handle temperature conversion
-            if from_unit in ['kelvin', 'celsius', 'fahrenheit'] and to_unit in ['kelvin', 'celsius', 'fahrenheit']:
-                if from_unit == 'kelvin':
-                    kelvin_value = value
-                elif from_unit == 'celsius':
-                    kelvin_value = normalize_to_base(value, from_unit)
-                elif from_unit == 'fahrenheit':
-                    kelvin_value = normalize_to_base(value, from_unit)
-
-                if to_unit == 'kelvin':
-                    return kelvin_value
-                elif to_unit == 'celsius':
-                    return convert_from_base(kelvin_value, to_unit)
-                elif to_unit == 'fahrenheit':
-                    return convert_from_base(kelvin_value, to_unit)
-            else:
-                # Convert to base unit
-                base_value = normalize_to_base(value, from_unit)
-                # Convert from base unit to target unit
-                return convert_from_base(base_value, to_unit)
-        except KeyError:
-            print(f"Error: Conversion factor not found for {from_unit} to base or from base to {to_unit}")
-            return None
+        return convert_compatible(value, from_unit, to_unit)
     else:
         print(f"Error: Incompatible units: {from_unit} and {to_unit}")
-        return None
\ No newline at end of file
+        return None
+
+def convert_compatible(value, from_unit, to_unit):
+    """Convert between units already known to be compatible (see is_compatible)"""
+    if from_unit == to_unit:
+        return value
+
+    try:
+        return get_converter(from_unit, to_unit)(value)
+    except ValueError:
+        print(f"Error: Conversion factor not found for {from_unit} to base or from base to {to_unit}")
+        return None